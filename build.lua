@@ -97,13 +97,10 @@ local translation_map = {
 }
 
 -- Check if string contains Chinese characters
+-- U+4E00..U+9FFF is E4 B8 80 .. E9 BF BF in UTF-8, so a byte-class find
+-- (run in C) replaces decoding every code point of the name
 local function has_chinese(str)
-  for _, code in utf8.codes(str) do
-    if code >= 0x4e00 and code <= 0x9fff then
-      return true
-    end
-  end
-  return false
+  return str:find("[\229-\233]") ~= nil or str:find("\228[\184-\191]") ~= nil
 end
 
 -- Get directory separator
@@ -191,6 +188,58 @@ local function list_dir(path)
   return entries
 end
 
+-- Snapshot a whole tree with two `find` calls instead of an `ls` per
+-- directory plus a `test -d` per entry. Returns { dirs = {path = true},
+-- children = {dir = {names}} } keyed by the same join_path strings the
+-- recursive walkers build; nil on Windows, where callers fall back to
+-- list_dir/is_dir.
+-- Matches what `ls -1` + `test -d` saw: hidden entries are pruned and
+-- symlinks are followed (-L), so a symlinked directory is a directory.
+-- Names are sorted bytewise, not in the locale order `ls` used.
+local function scan_tree(root)
+  if get_sep() == "\\" then
+    return nil
+  end
+  local tree = { dirs = { [root] = true }, children = { [root] = {} } }
+  local function add(line, dir)
+    local rel = line:sub(#root + 1):gsub("^/+", "")
+    if rel == "" then return end
+    local parent_rel, name = rel:match("^(.*)/([^/]+)$")
+    local parent = parent_rel and join_path(root, parent_rel) or root
+    local full_path = join_path(root, rel)
+    tree.children[parent] = tree.children[parent] or {}
+    table.insert(tree.children[parent], name or rel)
+    if dir then
+      tree.dirs[full_path] = true
+      tree.children[full_path] = tree.children[full_path] or {}
+    end
+  end
+  for _, spec in ipairs({ { "-type d", true }, { "! -type d", false } }) do
+    local handle = io.popen('find -L "' .. root .. '" -mindepth 1 -name ".*" -prune -o '
+      .. spec[1] .. ' -print 2>/dev/null')
+    if not handle then return nil end
+    for line in handle:lines() do
+      add(line, spec[2])
+    end
+    handle:close()
+  end
+  for _, names in pairs(tree.children) do
+    table.sort(names)
+  end
+  return tree
+end
+
+-- list_dir/is_dir answered from a scan_tree snapshot when one is available
+local function tree_list(tree, path)
+  if tree then return tree.children[path] or {} end
+  return list_dir(path)
+end
+
+local function tree_is_dir(tree, path)
+  if tree then return tree.dirs[path] == true end
+  return is_dir(path)
+end
+
 -- Remove file or directory recursively
 local function remove_path(path)
   local sep = get_sep()
@@ -279,14 +328,15 @@ local function sanitize_file(filepath)
 end
 
 -- Recursively walk directory and apply function to files
-local function walk_dir(path, fn, extensions)
-  local entries = list_dir(path)
+-- (tree: optional scan_tree snapshot of path)
+local function walk_dir(path, fn, extensions, tree)
+  local entries = tree_list(tree, path)
   for _, entry in ipairs(entries) do
     local full_path = join_path(path, entry)
-    if is_dir(full_path) then
+    if tree_is_dir(tree, full_path) then
       -- Skip certain directories
       if entry ~= ".git" and entry ~= "build" and entry ~= "__pycache__" and entry ~= ".vscode" then
-        walk_dir(full_path, fn, extensions)
+        walk_dir(full_path, fn, extensions, tree)
       end
     else
       -- Check extension
@@ -316,48 +366,166 @@ local function sanitize_project_files()
   print("--- Check complete ---")
 end
 
--- Update references in .tex files when renaming
-local function update_tex_references(build_dir, old_name, new_name)
-  -- Also replace without extension (e.g. \documentclass[自定义族谱]{ltc-guji})
-  local old_base = old_name:match("^(.+)%.[^.]+$")
-  local new_base = new_name:match("^(.+)%.[^.]+$")
+-- Load every .tex file under build_dir once. Renames only record the
+-- reference updates they need; flush_tex_index applies all of them to the
+-- in-memory copies and writes the changed files back after the renames.
+local function load_tex_index(build_dir, tree)
+  local index = { files = {}, renames = {}, updates = {} }
   walk_dir(build_dir, function(filepath, filename)
     if filename:match("%.tex$") then
       local content = read_file(filepath)
       if content then
-        local changed = false
-        if content:find(old_name, 1, true) then
-          print("  Updating reference in " .. filepath .. ": " .. old_name .. " -> " .. new_name)
-          content = content:gsub(old_name:gsub("([%.%-%+])", "%%%1"), new_name)
-          changed = true
+        table.insert(index.files, { path = filepath, content = content })
+      end
+    end
+  end, nil, tree)
+  return index
+end
+
+-- True if path is dir itself or lies somewhere below it
+local function path_under(path, dir)
+  return path == dir or path:sub(1, #dir + 1) == dir .. get_sep()
+end
+
+-- Record that .tex files under build_dir must refer to new_name instead of old_name
+local function update_tex_references(tex_index, build_dir, old_name, new_name)
+  table.insert(tex_index.updates, { scope = build_dir, old = old_name, new = new_name })
+  -- Also replace without extension (e.g. \documentclass[自定义族谱]{ltc-guji})
+  local old_base = old_name:match("^(.+)%.[^.]+$")
+  local new_base = new_name:match("^(.+)%.[^.]+$")
+  if old_base then
+    table.insert(tex_index.updates, { scope = build_dir, old = old_base, new = new_base })
+  end
+end
+
+-- Build a matcher for replace_names from `map` (old -> new). Candidates are
+-- bucketed by first byte, longest first, and a lead-byte class lets
+-- string.find jump straight to the next possible start.
+local function compile_names(map)
+  local by_lead = {}
+  for old, new in pairs(map) do
+    local lead = old:sub(1, 1)
+    by_lead[lead] = by_lead[lead] or {}
+    table.insert(by_lead[lead], { old = old, new = new })
+  end
+  local class = {}
+  for lead, bucket in pairs(by_lead) do
+    table.sort(bucket, function(a, b) return #a.old > #b.old end)
+    table.insert(class, lead:match("%w") and lead or lead:byte() < 128 and "%" .. lead or lead)
+  end
+  if #class == 0 then return nil end
+  return { by_lead = by_lead, lead_pattern = "[" .. table.concat(class) .. "]" }
+end
+
+-- Replace every name of a compile_names matcher in a single left-to-right
+-- pass, preferring the longest name at each position, so a short name (史记)
+-- can no longer eat the prefix of a longer one (史记目录).
+local function replace_names(content, matcher, hits)
+  if not matcher then return content end
+  local by_lead, lead_pattern = matcher.by_lead, matcher.lead_pattern
+
+  local out = {}
+  local last = 1
+  local pos = content:find(lead_pattern, 1)
+  while pos do
+    local matched
+    for _, r in ipairs(by_lead[content:sub(pos, pos)]) do
+      if content:sub(pos, pos + #r.old - 1) == r.old then
+        matched = r
+        break
+      end
+    end
+    if matched then
+      out[#out + 1] = content:sub(last, pos - 1)
+      out[#out + 1] = matched.new
+      hits[#hits + 1] = matched
+      last = pos + #matched.old
+      pos = content:find(lead_pattern, last)
+    else
+      pos = content:find(lead_pattern, pos + 1)
+    end
+  end
+  if last == 1 then return content end
+  out[#out + 1] = content:sub(last)
+  return table.concat(out)
+end
+
+-- Apply the recorded reference updates and write changed .tex files back to
+-- wherever the renames moved them. Renames are recorded bottom-up (a file
+-- before its parent directories), so replaying them in order maps an
+-- original path to its final path.
+-- Files under the same set of scopes (e.g. one directory) share a matcher.
+local function flush_tex_index(tex_index)
+  local matchers = {}
+  for _, file in ipairs(tex_index.files) do
+    if not file.removed then
+      local applicable = {}
+      for i, u in ipairs(tex_index.updates) do
+        if path_under(file.path, u.scope) then
+          applicable[#applicable + 1] = i
+        end
+      end
+      local key = table.concat(applicable, ",")
+      if matchers[key] == nil then
+        local map = {}
+        for _, i in ipairs(applicable) do
+          local u = tex_index.updates[i]
+          map[u.old] = u.new
         end
-        if old_base and content:find(old_base, 1, true) then
-          print("  Updating reference in " .. filepath .. ": " .. old_base .. " -> " .. new_base)
-          content = content:gsub(old_base:gsub("([%.%-%+])", "%%%1"), new_base)
-          changed = true
+        matchers[key] = compile_names(map) or false
+      end
+      local hits = {}
+      local content = replace_names(file.content, matchers[key] or nil, hits)
+      if #hits > 0 then
+        local seen = {}
+        for _, r in ipairs(hits) do
+          if not seen[r.old] then
+            seen[r.old] = true
+            print("  Updating reference in " .. file.path .. ": " .. r.old .. " -> " .. r.new)
+          end
         end
-        if changed then
-          write_file(filepath, content)
+        local path = file.path
+        for _, r in ipairs(tex_index.renames) do
+          if path_under(path, r.old) then
+            path = r.new .. path:sub(#r.old + 1)
+          end
         end
+        write_file(path, content)
       end
     end
-  end)
+  end
 end
 
 -- Recursively rename Chinese filenames to ASCII (bottom-up)
-local function translate_names(path, is_root)
-  local entries = list_dir(path)
+-- tree is a scan_tree snapshot taken before any rename: recursion only
+-- changes the contents of subdirectories and a directory is renamed only
+-- after its own contents, so the snapshot listing of each level stays valid.
+local function translate_names(path, is_root, tex_index, tree)
+  local entries = tree_list(tree, path)
 
   -- First, recurse into subdirectories
   for _, entry in ipairs(entries) do
     local full_path = join_path(path, entry)
-    if is_dir(full_path) then
-      translate_names(full_path, false)
+    if tree_is_dir(tree, full_path) then
+      translate_names(full_path, false, tex_index, tree)
     end
   end
 
   -- Then, process files and directories at this level
-  entries = list_dir(path) -- Re-read after recursion
+  -- With a snapshot, `present` tracks the names at this level as they are
+  -- removed and renamed, so the destination check below needs no probe.
+  -- It relies on scan_tree listing exactly what list_dir would (hidden
+  -- entries left out, symlinked directories followed); rename targets in
+  -- translation_map are never hidden names.
+  local present
+  if tree then
+    present = {}
+    for _, entry in ipairs(entries) do
+      present[entry] = true
+    end
+  else
+    entries = list_dir(path) -- Re-read after recursion
+  end
   for _, entry in ipairs(entries) do
     local full_path = join_path(path, entry)
 
@@ -365,6 +533,7 @@ local function translate_names(path, is_root)
     if entry:match("%.aux$") or entry:match("%.log$") then
       print("  Removing auxiliary file: " .. full_path)
       remove_path(full_path)
+      if present then present[entry] = nil end
     elseif translation_map[entry] then
       local new_name = translation_map[entry]
       local new_path = join_path(path, new_name)
@@ -372,16 +541,32 @@ local function translate_names(path, is_root)
       print("  Renaming: " .. entry .. " -> " .. new_name)
 
       -- Update references in .tex files if it's a non-.tex file
-      if not entry:match("%.tex$") and not is_dir(full_path) then
-        update_tex_references(is_root and path or path:match("^(.+)[/\\]") or path, entry, new_name)
+      if not entry:match("%.tex$") and not tree_is_dir(tree, full_path) then
+        update_tex_references(tex_index, is_root and path or path:match("^(.+)[/\\]") or path, entry, new_name)
       end
 
       -- Remove destination if exists
-      if path_exists(new_path) or is_dir(new_path) then
+      local exists
+      if present then
+        exists = present[new_name]
+      else
+        exists = path_exists(new_path) or is_dir(new_path)
+      end
+      if exists then
         remove_path(new_path)
+        for _, file in ipairs(tex_index.files) do
+          if path_under(file.path, new_path) then
+            file.removed = true
+          end
+        end
       end
 
       rename_path(full_path, new_path)
+      table.insert(tex_index.renames, { old = full_path, new = new_path })
+      if present then
+        present[entry] = nil
+        present[new_name] = true
+      end
     elseif has_chinese(entry) then
       print("CRITICAL ERROR: Chinese characters found in filename '" .. entry .. "' at " .. full_path)
       print("Please add this filename to the translation_map in build.lua")
@@ -462,7 +647,10 @@ local function post_process_ctan(staging_path)
 
   -- 3. Translate Chinese filenames to ASCII
   print("\n>>> Translating Chinese filenames...")
-  translate_names(staging_path, true)
+  local tree = scan_tree(staging_path)
+  local tex_index = load_tex_index(staging_path, tree)
+  translate_names(staging_path, true, tex_index, tree)
+  flush_tex_index(tex_index)
 
   print("\n=== Post-processing complete ===\n")
 end
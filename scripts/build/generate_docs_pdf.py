@@ -1,73 +1,227 @@
+import argparse
+import concurrent.futures
+import hashlib
 import os
+import re
 import subprocess
 import shutil
 from pathlib import Path
 
+
+def tex_preamble(markdown_options=""):
+    """LaTeX preamble with Chinese and Markdown support."""
+    markdown_options = f"[{markdown_options}]" if markdown_options else ""
+    return rf"""\documentclass{{article}}
+\usepackage[UTF8, scheme=plain]{{ctex}}
+\usepackage{markdown_options}{{markdown}}
+\usepackage{{geometry}}
+\geometry{{a4paper, margin=1in}}
+"""
+
+
+TEX_PREAMBLE = tex_preamble()
+
+BATCH_STEM = "tmp_all"
+
+
+# Local files a Markdown document pulls in: ![alt](path) images and HTML src="path"
+_ASSET_RE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)|\bsrc\s*=\s*["\']([^"\']+)["\']')
+
+
+def referenced_assets(md_file):
+    """Local files referenced by a Markdown file, resolved against its directory."""
+    md_file = Path(md_file)
+    text = md_file.read_text(encoding="utf-8", errors="ignore")
+    assets = set()
+    for match in _ASSET_RE.finditer(text):
+        ref = (match.group(1) or match.group(2)).split("#", 1)[0]
+        if ref and "://" not in ref and not ref.startswith("data:"):
+            assets.add(md_file.parent / ref)
+    return sorted(assets)
+
+
+def source_hash(md_file, mode):
+    """Hash of everything a file's PDF depends on: its Markdown, the local
+    assets it references, the preamble and the build mode ("batch" or "single")."""
+    md_file = Path(md_file)
+    h = hashlib.sha256()
+    for part in (md_file.read_bytes(), TEX_PREAMBLE.encode("utf-8"), mode.encode("utf-8")):
+        h.update(hashlib.sha256(part).digest())
+    for asset in referenced_assets(md_file):
+        h.update(os.path.relpath(asset, md_file.parent).encode("utf-8") + b"\0")
+        try:
+            h.update(hashlib.sha256(asset.read_bytes()).digest())
+        except OSError:
+            h.update(b"missing")
+    return h.hexdigest()
+
+
+def hash_file(md_file):
+    """Sidecar recording the source_hash of the last successful build."""
+    md_file = Path(md_file)
+    return md_file.parent / f".{md_file.stem}.sha256"
+
+
+def is_up_to_date(md_file, mode):
+    md_file = Path(md_file)
+    if not (md_file.parent / f"{md_file.stem}.pdf").exists():
+        return False
+    try:
+        return hash_file(md_file).read_text().strip() == source_hash(md_file, mode)
+    except FileNotFoundError:
+        return False
+
+
+def print_log_tail(log_file, n=20):
+    """Print the last n lines of a LaTeX log, if there is one."""
+    try:
+        lines = Path(log_file).read_text(encoding="utf-8", errors="ignore").splitlines()
+    except FileNotFoundError:
+        return
+    print("\n".join(lines[-n:]))
+
+
 def generate_pdf(md_file, output_dir):
     md_file = Path(md_file)
     output_dir = Path(output_dir)
     stem = md_file.stem
-    tex_file = output_dir / f"tmp_{stem}.tex"
+    # Sources, aux and log go to a per-job directory; -jobname makes lualatex
+    # name the PDF after the document, so it only has to be moved into place.
+    build_dir = output_dir / f".build_{stem}"
+    build_dir.mkdir(exist_ok=True)
+    tex_file = build_dir / "main.tex"
     
-    # LaTeX template with Chinese and Markdown support
-    tex_content = rf"""\documentclass{{article}}
-\usepackage[UTF8, scheme=plain]{{ctex}}
-\usepackage{{markdown}}
-\usepackage{{geometry}}
-\geometry{{a4paper, margin=1in}}
-\begin{{document}}
+    # The markdown package writes its helper files and cache under outputDir,
+    # which has to match -output-directory or it cannot find them again
+    tex_content = tex_preamble(f"outputDir={build_dir.name}") + rf"""\begin{{document}}
 \markdownInput{{{md_file.name}}}
 \end{{document}}
 """
     
-    with open(tex_file, "w", encoding="utf-8") as f:
-        f.write(tex_content)
+    tex_file.write_bytes(tex_content.encode("utf-8"))
     
     print(f"Compiling {md_file.name}...")
     try:
         # Run lualatex in the output directory so relative paths in md work
+        cmd = ["lualatex", "-interaction=nonstopmode", f"-jobname={stem}",
+               f"-output-directory={build_dir.name}", f"{build_dir.name}/{tex_file.name}"]
         result = subprocess.run(
-            ["lualatex", "-interaction=nonstopmode", tex_file.name],
+            cmd,
             cwd=output_dir,
             capture_output=True,
             text=True
         )
-        
         if result.returncode != 0:
             print(f"Error compiling {md_file.name}:")
             # print(result.stdout)
             # Find last few lines of log if error
-            log_file = output_dir / f"tmp_{stem}.log"
-            if log_file.exists():
-                with open(log_file, "r", encoding="utf-8", errors="ignore") as lf:
-                    print("".join(lf.readlines()[-20:]))
+            log_file = build_dir / f"{stem}.log"
+            print_log_tail(log_file)
             return False
         
-        # Move PDF to final name
+        # os.replace overwrites an existing PDF atomically
         final_pdf = output_dir / f"{stem}.pdf"
-        generated_pdf = output_dir / f"tmp_{stem}.pdf"
-        if generated_pdf.exists():
-            if final_pdf.exists():
-                os.remove(final_pdf)
-            shutil.move(generated_pdf, final_pdf)
-            print(f"Successfully generated {final_pdf}")
-            return True
-        else:
+        try:
+            os.replace(build_dir / f"{stem}.pdf", final_pdf)
+        except FileNotFoundError:
             print(f"PDF was not generated for {md_file.name}")
             return False
+        print(f"Successfully generated {final_pdf}")
+        return True
             
     finally:
-        # Cleanup temporary files
-        for ext in [".tex", ".aux", ".log", ".out", ".toc"]:
-            tmp_f = output_dir / f"tmp_{stem}{ext}"
+        # Cleanup the job directory, markdown cache included
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+def generate_pdfs_batch(md_files, output_dir):
+    """Compile all Markdown files in a single lualatex run, then split the PDF.
+
+    Pays the format/font loading cost once instead of once per file. Each
+    document starts on a fresh page with its page, sectioning, footnote and
+    float counters reset, so its pages are numbered as in a per-file build;
+    its first physical page is written to tmp_all.pages so the combined PDF
+    can be cut back into one PDF per file.
+    Splitting needs pikepdf (pip install pikepdf).
+
+    Returns the Markdown files whose PDF was generated.
+    """
+    import pikepdf
+
+    output_dir = Path(output_dir)
+    tex_file = output_dir / f"{BATCH_STEM}.tex"
+    pages_file = output_dir / f"{BATCH_STEM}.pages"
+
+    body = "".join(
+        rf"\markdocstart\markdownInput{{{Path(f).name}}}" + "\n" for f in md_files)
+    tex_content = TEX_PREAMBLE + rf"""\newwrite\docpages
+\immediate\openout\docpages={pages_file.name}
+\newcommand\markdocstart{{\clearpage
+  \setcounter{{page}}{{1}}\setcounter{{footnote}}{{0}}%
+  \setcounter{{section}}{{0}}\setcounter{{subsection}}{{0}}%
+  \setcounter{{subsubsection}}{{0}}\setcounter{{paragraph}}{{0}}%
+  \setcounter{{figure}}{{0}}\setcounter{{table}}{{0}}\setcounter{{equation}}{{0}}%
+  \immediate\write\docpages{{\the\numexpr\ReadonlyShipoutCounter+1\relax}}}}
+\begin{{document}}
+{body}\clearpage
+\immediate\closeout\docpages
+\end{{document}}
+"""
+
+    tex_file.write_bytes(tex_content.encode("utf-8"))
+
+    print(f"Compiling {len(md_files)} files in one batch...")
+    try:
+        result = subprocess.run(
+            ["lualatex", "-interaction=nonstopmode", tex_file.name],
+            cwd=output_dir,
+            capture_output=True,
+            text=True
+        )
+
+        generated_pdf = output_dir / f"{BATCH_STEM}.pdf"
+        if result.returncode != 0 or not generated_pdf.exists() or not pages_file.exists():
+            print("Error compiling batch:")
+            log_file = output_dir / f"{BATCH_STEM}.log"
+            print_log_tail(log_file)
+            return []
+
+        starts = [int(line) for line in pages_file.read_text().split()]
+        generated = []
+        with pikepdf.open(generated_pdf) as combined:
+            ends = starts[1:] + [len(combined.pages) + 1]
+            for md_file, first, end in zip(md_files, starts, ends):
+                md_file = Path(md_file)
+                if end <= first:
+                    print(f"PDF was not generated for {md_file.name}")
+                    continue
+                final_pdf = output_dir / f"{md_file.stem}.pdf"
+                part = pikepdf.new()
+                part.pages.extend(combined.pages[first - 1:end - 1])
+                part.save(final_pdf)
+                print(f"Successfully generated {final_pdf}")
+                generated.append(md_file)
+        return generated
+
+    finally:
+        for ext in [".tex", ".aux", ".log", ".out", ".toc", ".pdf", ".pages"]:
+            tmp_f = output_dir / f"{BATCH_STEM}{ext}"
             if tmp_f.exists():
                 os.remove(tmp_f)
-        # Cleanup markdown cache dir
-        cache_dir = output_dir / f"_markdown_tmp_{stem}"
+        cache_dir = output_dir / f"_markdown_{BATCH_STEM}"
         if cache_dir.exists() and cache_dir.is_dir():
             shutil.rmtree(cache_dir)
 
 def main():
+    parser = argparse.ArgumentParser(description="Compile docs Markdown files to PDF")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of parallel lualatex jobs (default: cpu count)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every PDF, even if its Markdown is unchanged")
+    parser.add_argument("--batch", action="store_true",
+                        help="Compile all files in one lualatex run and split the PDF "
+                             "(requires pikepdf)")
+    args = parser.parse_args()
+
     # Find docs directory relative to script location
     script_dir = Path(__file__).parent
     project_root = script_dir.parent.parent
@@ -84,10 +238,36 @@ def main():
         return 0
 
     print(f"Found {len(md_files)} Markdown files in {docs_dir}")
+    # Skip files whose sources and build mode match the last successful build
+    mode = "batch" if args.batch else "single"
+    if not args.force:
+        stale = [f for f in md_files if not is_up_to_date(f, mode)]
+        if len(stale) < len(md_files):
+            print(f"Skipping {len(md_files) - len(stale)} unchanged file(s) (use --force to rebuild)")
+        md_files = stale
+        if not md_files:
+            return 0
+
+    if args.batch:
+        generated = generate_pdfs_batch(md_files, docs_dir)
+        for f in generated:
+            hash_file(f).write_text(source_hash(f, mode) + "\n")
+        success_count = len(generated)
+        print(f"\nSummary: {success_count}/{len(md_files)} PDFs generated successfully.")
+        return 0 if success_count == len(md_files) else 1
+
+    # Each job writes only to .build_{stem}/, so jobs never collide; the real work happens in the lualatex subprocess, so threads suffice.
+    jobs = max(1, min(args.jobs, len(md_files)))
     success_count = 0
-    for md_file in md_files:
-        if generate_pdf(md_file, docs_dir):
-            success_count += 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(generate_pdf, f, docs_dir): f for f in md_files}
+        # Record each success as soon as it lands, so an interrupted run
+        # does not rebuild the files that already finished
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                f = futures[future]
+                hash_file(f).write_text(source_hash(f, mode) + "\n")
+                success_count += 1
 
     print(f"\nSummary: {success_count}/{len(md_files)} PDFs generated successfully.")
     return 0 if success_count == len(md_files) else 1
@@ -11,7 +11,12 @@ Options:
     --dpi DPI          Resolution for PNG conversion (default: 150)
     --threshold N      Pixel difference threshold to consider a page changed
                        (default: 10)
-    --stop-on-first    Stop after the first differing page is found
+    --stop-on-first    Stop after the first differing page is found; pages are
+                       rendered a slice at a time, so an early difference
+                       does not wait for the whole document to render
+    --jobs N           Number of pages to diff in parallel (default: CPU count)
+    --no-cache         Always re-render; do not read or write the page cache
+                       (at most 2 GB, see below)
 
 Output:
     - Prints a summary of which pages differ and how many pixels changed.
@@ -22,10 +27,19 @@ Output:
       Middle panel: diff (identical pixels grey, A-only blue, B-only red)
     - Exits with code 0 if no differences, 1 if differences found.
 
+Rendered pages are cached under ~/.cache/luatex-cn/compare_pdfs/<sha1>/<dpi>/
+(or $XDG_CACHE_HOME/...), keyed by the PDF's content hash, so an unchanged
+baseline PDF is rendered only once. The cache is trimmed to CACHE_MAX_BYTES,
+least recently used first.
+
 The script uses test/image_compare.py as a shared library.
 """
 
 import argparse
+import concurrent.futures
+import hashlib
+import os
+import shutil
 import sys
 import tempfile
 from pathlib import Path
@@ -34,40 +48,163 @@ from pathlib import Path
 _SCRIPT_DIR = Path(__file__).resolve().parent
 sys.path.insert(0, str(_SCRIPT_DIR))
 
-from image_compare import compare_images, pdf_to_pngs
+from image_compare import (compare_arrays, files_identical, load_rgb, pdf_page_count,
+                           pdfs_to_pngs, start_render_pages)
 from PIL import Image
+import numpy as np
 
 
-def make_side_by_side(img_a: Path, img_b: Path, diff_img: Path, out: Path) -> None:
-    """Create a three-panel side-by-side comparison image.
+def make_side_by_side(a: np.ndarray, b: np.ndarray, d: np.ndarray, out: Path) -> None:
+    """Create a three-panel side-by-side comparison image from pixel arrays.
 
     Panels: [A | diff | B]
     """
-    a = Image.open(img_a).convert("RGB")
-    b = Image.open(img_b).convert("RGB")
-    d = Image.open(diff_img).convert("RGB")
-
-    # Normalise heights
-    h = max(a.height, b.height, d.height)
-
-    def pad_height(img, target_h):
-        if img.height < target_h:
-            padded = Image.new("RGB", (img.width, target_h), (255, 255, 255))
-            padded.paste(img, (0, 0))
-            return padded
-        return img
 
-    a = pad_height(a, h)
-    b = pad_height(b, h)
-    d = pad_height(d, h)
-
-    gap = 10  # white gap between panels
-    total_w = a.width + gap + d.width + gap + b.width
-    canvas = Image.new("RGB", (total_w, h), (200, 200, 200))
-    canvas.paste(a, (0, 0))
-    canvas.paste(d, (a.width + gap, 0))
-    canvas.paste(b, (a.width + gap + d.width + gap, 0))
-    canvas.save(str(out))
+    # Normalise heights (pad the bottom with white)
+    h = max(a.shape[0], b.shape[0], d.shape[0])
+
+    def pad_height(arr, target_h):
+        if arr.shape[0] < target_h:
+            return np.pad(arr, ((0, target_h - arr.shape[0]), (0, 0), (0, 0)),
+                          constant_values=255)
+        return arr
+
+    gap = np.full((h, 10, 3), 200, dtype=np.uint8)  # grey gap between panels
+    canvas = np.concatenate(
+        [pad_height(a, h), gap, pad_height(d, h), gap, pad_height(b, h)], axis=1)
+    Image.fromarray(canvas).save(str(out))
+
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) \
+    / "luatex-cn" / "compare_pdfs"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _cache_entry(pdf: Path, dpi: int) -> Path:
+    """Cache directory for the pages of *pdf* rendered at *dpi*."""
+    sha1 = hashlib.sha1()
+    with open(pdf, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return CACHE_DIR / sha1.hexdigest() / str(dpi)
+
+
+def _evict_cache() -> None:
+    """Drop least recently used entries until the cache fits CACHE_MAX_BYTES."""
+    entries = []
+    for done in CACHE_DIR.glob("*/*/done"):
+        entry = done.parent
+        size = sum(f.stat().st_size for f in entry.iterdir())
+        entries.append((done.stat().st_mtime, size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def cached_pdfs_to_pngs(pdfs: list, output_dirs: list, dpi: int, chunks: int = 1,
+                        entries: list | None = None) -> list:
+    """pdfs_to_pngs with a content-addressed page cache in front of it.
+
+    Cached pages are copied into *output_dirs*; only PDFs without a
+    complete cache entry (marked by a `done` file) are rendered, and their
+    pages are then stored for the next run. Pass *entries* (from
+    _cache_entry) when the caller has already hashed the PDFs.
+    """
+    results = [None] * len(pdfs)
+    if entries is None:
+        entries = [_cache_entry(pdf, dpi) for pdf in pdfs]
+    missing = []
+    for i, (pdf, out_dir, entry) in enumerate(zip(pdfs, output_dirs, entries)):
+        done = entry / "done"
+        if not done.exists():
+            missing.append(i)
+            continue
+        n_pages = int(done.read_text())
+        pngs = []
+        for n in range(1, n_pages + 1):
+            dest = out_dir / f"{pdf.stem}-{n}.png"
+            shutil.copyfile(entry / f"page-{n}.png", dest)
+            pngs.append(dest)
+        done.touch()  # mark as recently used
+        results[i] = pngs
+
+    if missing:
+        rendered = pdfs_to_pngs([pdfs[i] for i in missing],
+                                [output_dirs[i] for i in missing], dpi=dpi,
+                                chunks=chunks)
+        for i, pngs in zip(missing, rendered):
+            results[i] = pngs
+            if not pngs:
+                continue
+            entry = entries[i]
+            entry.mkdir(parents=True, exist_ok=True)
+            for n, png in enumerate(pngs, start=1):
+                shutil.copyfile(png, entry / f"page-{n}.png")
+            (entry / "done").write_text(str(len(pngs)))
+        _evict_cache()
+
+    return results
+
+
+STREAM_CHUNK = 8  # pages per pdftoppm call with --stop-on-first
+
+
+def _rendered_batches(pdf_a: Path, pdf_b: Path, dir_a: Path, dir_b: Path,
+                      dpi: int, n_pages: int, total_a: int, total_b: int):
+    """Render both PDFs STREAM_CHUNK pages at a time.
+
+    *n_pages* is the number of pages to compare; *total_a* and *total_b*
+    are the PDFs' own page counts, which fix pdftoppm's output names.
+
+    Yields one list of (png_a, png_b) pairs per slice while pdftoppm is
+    already rendering the next slice, or None if a slice failed to render.
+    The renders are plain background processes rather than threads, so the
+    diff pool can still fork safely.
+    """
+    ranges = [(first, min(first + STREAM_CHUNK - 1, n_pages))
+              for first in range(1, n_pages + 1, STREAM_CHUNK)]
+
+    # These pages live in a temp dir and are decoded once, so render them as
+    # uncompressed PPM rather than paying for PNG compression both ways
+    def start(first, last):
+        return (start_render_pages(pdf_a, dir_a, first, last, dpi, ext="ppm", n_pages=total_a),
+                start_render_pages(pdf_b, dir_b, first, last, dpi, ext="ppm", n_pages=total_b))
+
+    pending = start(*ranges[0]) if ranges else None
+    try:
+        for k, (first, last) in enumerate(ranges):
+            wait_a, wait_b = pending
+            pending = start(*ranges[k + 1]) if k + 1 < len(ranges) else None
+            pngs_a, pngs_b = wait_a(), wait_b()
+            if len(pngs_a) != last - first + 1 or len(pngs_b) != last - first + 1:
+                yield None
+                return
+            yield list(zip(pngs_a, pngs_b))
+    finally:
+        # Closed early (--stop-on-first): reap the slice still rendering
+        if pending:
+            for wait in pending:
+                wait()
+
+
+def _diff_one_page(task: tuple) -> int:
+    """Worker for the page pool: diff one page pair, return the diff count.
+
+    Pages above the threshold get their side-by-side image written to
+    *compare_png* straight from the decoded pixels, so neither the diff nor
+    the page PNGs are encoded and decoded again.
+    """
+    png_a, png_b, compare_png, threshold = task
+    if files_identical(png_a, png_b):
+        return 0
+    a, b = load_rgb(png_a), load_rgb(png_b)
+    diff_count, _, _, diff = compare_arrays(a, b)
+    if diff_count > threshold:
+        make_side_by_side(a, b, diff, compare_png)
+    return diff_count
 
 
 def compare_pdfs(
@@ -77,13 +214,20 @@ def compare_pdfs(
     dpi: int = 150,
     threshold: int = 10,
     stop_on_first: bool = False,
+    jobs: int | None = None,
+    use_cache: bool = True,
 ) -> bool:
     """Compare two PDFs page by page.
 
     Returns True if the PDFs are visually identical (within threshold),
     False if differences are found.
 
-    If stop_on_first is True, stops after the first differing page.
+    If stop_on_first is True, stops after the first differing page; unless
+    both PDFs are already cached, pages are then rendered and diffed slice
+    by slice instead of rendering everything up front.
+    Pages are diffed in parallel across *jobs* worker processes
+    (default: CPU count); results are still reported in page order.
+    Unless use_cache is False, rendered pages are reused from CACHE_DIR.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -100,19 +244,33 @@ def compare_pdfs(
         for d in [dir_a, dir_b, dir_diff]:
             d.mkdir()
 
-        print("Converting PDF A to PNGs…")
-        pngs_a = pdf_to_pngs(pdf_a, dir_a, dpi=dpi)
-        if not pngs_a:
+        # Hash each PDF once; the entries serve both the streaming decision
+        # and the cached render below
+        entries = [_cache_entry(p, dpi) for p in (pdf_a, pdf_b)] if use_cache else None
+        streaming = stop_on_first and not (
+            entries and all((entry / "done").exists() for entry in entries))
+        if streaming:
+            print(f"Rendering PDF A and PDF B {STREAM_CHUNK} pages at a time…")
+            n_a, n_b = pdf_page_count(pdf_a), pdf_page_count(pdf_b)
+        else:
+            print("Converting PDF A and PDF B to PNGs…")
+            # Split each PDF's pages across half the workers (both PDFs render at once)
+            chunks = max(1, (jobs or os.cpu_count() or 1) // 2)
+            if use_cache:
+                pngs_a, pngs_b = cached_pdfs_to_pngs([pdf_a, pdf_b], [dir_a, dir_b], dpi, chunks,
+                                                     entries)
+            else:
+                pngs_a, pngs_b = pdfs_to_pngs([pdf_a, pdf_b], [dir_a, dir_b], dpi=dpi,
+                                              chunks=chunks)
+            n_a, n_b = len(pngs_a), len(pngs_b)
+        if not n_a:
             print("ERROR: Failed to convert PDF A.")
             return False
 
-        print("Converting PDF B to PNGs…")
-        pngs_b = pdf_to_pngs(pdf_b, dir_b, dpi=dpi)
-        if not pngs_b:
+        if not n_b:
             print("ERROR: Failed to convert PDF B.")
             return False
 
-        n_a, n_b = len(pngs_a), len(pngs_b)
         print(f"PDF A: {n_a} pages   PDF B: {n_b} pages\n")
 
         if n_a != n_b:
@@ -123,28 +281,54 @@ def compare_pdfs(
         first_diff_page = None
         diff_pages = []
 
-        for i in range(n_pages):
-            page_num = i + 1
-            diff_tmp = dir_diff / f"diff_{page_num:04d}.png"
-            diff_count, _, _ = compare_images(pngs_a[i], pngs_b[i], diff_tmp)
-
-            if diff_count > threshold:
-                if first_diff_page is None:
-                    first_diff_page = page_num
-                diff_pages.append((page_num, diff_count))
-
-                # Build side-by-side comparison
-                out_path = output_dir / f"compare_page_{page_num:04d}.png"
-                make_side_by_side(pngs_a[i], pngs_b[i], diff_tmp, out_path)
-                print(f"  Page {page_num:4d}: {diff_count:>10,} pixels differ  →  {out_path.name}")
-
-                if stop_on_first:
-                    print(f"\n  (--stop-on-first: stopping after page {page_num})")
-                    break
-            elif diff_count > 0:
-                print(f"  Page {page_num:4d}: {diff_count:>10,} pixels differ  (below threshold, ignored)")
-            else:
-                print(f"  Page {page_num:4d}: identical")
+        if streaming:
+            batches = _rendered_batches(pdf_a, pdf_b, dir_a, dir_b, dpi, n_pages, n_a, n_b)
+        else:
+            batches = iter([list(zip(pngs_a, pngs_b))])
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                page_num = 0
+                stopped = False
+                for batch in batches:
+                    if batch is None:
+                        print("ERROR: Failed to convert PDF pages.")
+                        return False
+                    # Collect in page order so output and --stop-on-first stay
+                    # deterministic; later pages keep diffing in the background.
+                    compare_tmps = [dir_diff / f"compare_page_{page_num + i + 1:04d}.png"
+                                    for i in range(len(batch))]
+                    futures = [executor.submit(_diff_one_page, (a, b, c, threshold))
+                               for (a, b), c in zip(batch, compare_tmps)]
+                    for i, future in enumerate(futures):
+                        page_num += 1
+                        diff_count = future.result()
+
+                        if diff_count > threshold:
+                            if first_diff_page is None:
+                                first_diff_page = page_num
+                            diff_pages.append((page_num, diff_count))
+
+                            # Side-by-side comparison was built by the worker
+                            out_path = output_dir / compare_tmps[i].name
+                            shutil.move(compare_tmps[i], out_path)
+                            print(f"  Page {page_num:4d}: {diff_count:>10,} pixels differ  →  {out_path.name}")
+
+                            if stop_on_first:
+                                print(f"\n  (--stop-on-first: stopping after page {page_num})")
+                                for pending in futures[i + 1:]:
+                                    pending.cancel()
+                                stopped = True
+                                break
+                        elif diff_count > 0:
+                            print(f"  Page {page_num:4d}: {diff_count:>10,} pixels differ  (below threshold, ignored)")
+                        else:
+                            print(f"  Page {page_num:4d}: identical")
+                    if stopped:
+                        break
+        finally:
+            if streaming:
+                batches.close()
 
         # Handle page count mismatch tail
         if n_a != n_b:
@@ -201,6 +385,19 @@ def main():
         action="store_true",
         help="Stop after the first differing page is found",
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of pages to diff in parallel (default: CPU count)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always re-render; do not read or write the page cache "
+             f"(kept under {CACHE_DIR}, trimmed to "
+             f"{CACHE_MAX_BYTES // 1024 ** 3} GB, least recently used first)",
+    )
     args = parser.parse_args()
 
     pdf_a = Path(args.pdf_a).resolve()
@@ -223,6 +420,8 @@ def main():
         dpi=args.dpi,
         threshold=args.threshold,
         stop_on_first=args.stop_on_first,
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
     )
     sys.exit(0 if identical else 1)
 
@@ -5,9 +5,8 @@
 """
 
 from PIL import Image, ImageFilter
+import numpy as np
 import os
-import random
-import math
 
 # 目标颜色 (RGB) - 较浅的朱砂色
 TARGET_COLOR = (188, 50, 45)
@@ -16,76 +15,77 @@ TARGET_COLOR = (188, 50, 45)
 input_file = "文渊阁宝印.png"
 output_file = "文渊阁宝印-彩色.png"
 
-def add_aging_effect(img, intensity=0.5):
-    """添加强烈的做旧效果：大面积磨损、斑驳"""
-    pixels = img.load()
+def add_aging_effect(img, intensity=0.5, seed=None):
+    """添加强烈的做旧效果：大面积磨损、斑驳
+
+    所有随机数都由同一个 numpy 生成器整块生成，可用 seed 固定
+    """
     width, height = img.size
-    
+    arr = np.array(img, dtype=np.int32)
+    r, g, b, a = arr[..., 0], arr[..., 1], arr[..., 2], arr[..., 3]
+    opaque = a > 0  # 只处理非透明像素
+    rng = np.random.default_rng(seed)
+
     # 预先生成一些大的磨损区域中心点
     num_worn_areas = int(width * height * 0.0001)  # 更多磨损区域
-    worn_centers = [(random.randint(0, width-1), random.randint(0, height-1), 
-                     random.randint(5, 30)) for _ in range(num_worn_areas)]
-    
-    for y in range(height):
-        for x in range(width):
-            r, g, b, a = pixels[x, y]
-            
-            if a > 0:  # 只处理非透明像素
-                # 1. 计算是否在大磨损区域内
-                in_worn_area = False
-                for cx, cy, radius in worn_centers:
-                    dist = math.sqrt((x - cx)**2 + (y - cy)**2)
-                    if dist < radius:
-                        in_worn_area = True
-                        # 中心磨损更严重
-                        wear_factor = 1 - (dist / radius) * 0.5
-                        a = max(0, int(a * (1 - wear_factor * 0.8)))
-                        break
-                
-                # 2. 随机减淡 - 模拟褪色（更强）
-                fade_factor = random.uniform(0.7, 1.0)
-                r = int(r * fade_factor)
-                g = int(g * fade_factor)
-                b = int(b * fade_factor)
-                
-                # 3. 边缘更强的磨损
-                if a < 230:
-                    if random.random() < 0.5:
-                        a = max(0, a - random.randint(30, 100))
-                
-                # # 4. 随机小孔洞 - 更多更大
-                # if random.random() < intensity * 0.08:
-                #     a = max(0, a - random.randint(80, 255))
-                
-                # # 5. 细小的噪点纹理
-                # if random.random() < 0.3:
-                #     noise = random.randint(-25, 25)
-                #     r = max(0, min(255, r + noise))
-                #     g = max(0, min(255, g + noise))
-                #     b = max(0, min(255, b + noise))
-                
-                # pixels[x, y] = (r, g, b, a)
-    
+    worn_centers = list(zip(rng.integers(0, width, num_worn_areas).tolist(),
+                            rng.integers(0, height, num_worn_areas).tolist(),
+                            rng.integers(5, 31, num_worn_areas).tolist()))
+
+    # 1. 计算是否在大磨损区域内：每个像素取列表中第一个覆盖它的区域，
+    #    所以倒序处理，让靠前的区域覆盖靠后的。每个区域是半径不超过 30 的圆，
+    #    只在它的外接方框内计算距离
+    wear_factor = np.full((height, width), -1.0)
+    for cx, cy, radius in reversed(worn_centers):
+        y0, y1 = max(0, cy - radius + 1), min(height, cy + radius)
+        x0, x1 = max(0, cx - radius + 1), min(width, cx + radius)
+        yy, xx = np.ogrid[y0:y1, x0:x1]
+        dist = np.sqrt((xx - cx)**2 + (yy - cy)**2)
+        inside = dist < radius
+        # 中心磨损更严重
+        wear_factor[y0:y1, x0:x1][inside] = 1 - (dist[inside] / radius) * 0.5
+    in_worn_area = opaque & (wear_factor >= 0)
+    a = np.where(in_worn_area, np.maximum(0, (a * (1 - wear_factor * 0.8)).astype(np.int32)), a)
+
+    # 2. 随机减淡 - 模拟褪色（更强）
+    fade_factor = rng.uniform(0.7, 1.0, size=(height, width))
+    r = np.where(opaque, (r * fade_factor).astype(np.int32), r)
+    g = np.where(opaque, (g * fade_factor).astype(np.int32), g)
+    b = np.where(opaque, (b * fade_factor).astype(np.int32), b)
+
+    # 3. 边缘更强的磨损
+    edge = opaque & (a < 230) & (rng.random((height, width)) < 0.5)
+    a = np.where(edge, np.maximum(0, a - rng.integers(30, 101, size=(height, width))), a)
+
+    # # 4. 随机小孔洞 - 更多更大
+    # holes = opaque & (rng.random((height, width)) < intensity * 0.08)
+    # a = np.where(holes, np.maximum(0, a - rng.integers(80, 256, size=(height, width))), a)
+
+    # # 5. 细小的噪点纹理
+    # noisy = opaque & (rng.random((height, width)) < 0.3)
+    # noise = np.where(noisy, rng.integers(-25, 26, size=(height, width)), 0)
+    # r = np.clip(r + noise, 0, 255)
+    # g = np.clip(g + noise, 0, 255)
+    # b = np.clip(b + noise, 0, 255)
+
+    # img = Image.fromarray(np.stack([r, g, b, a], axis=-1).astype(np.uint8), "RGBA")
+
     return img
 
 def convert_to_color(input_path, output_path, target_rgb, add_aging=True):
     """将图片转换为指定颜色，保留透明度"""
     img = Image.open(input_path).convert("RGBA")
-    pixels = img.load()
-    width, height = img.size
-    
-    for y in range(height):
-        for x in range(width):
-            r, g, b, a = pixels[x, y]
-            
-            # 只要不透明，就直接使用目标颜色
-            if a > 0:
-                pixels[x, y] = (target_rgb[0], target_rgb[1], target_rgb[2], a)
-    
+
+    # 颜色整体换成目标颜色，只保留原图的 alpha 通道；
+    # 完全透明的像素颜色不可见，一并换掉也无妨（缩放时边缘也不会混入原色）
+    alpha = img.getchannel("A")
+    solid = Image.new("RGB", img.size, target_rgb)
+    img = Image.merge("RGBA", (*solid.split(), alpha))
+
     # 添加做旧效果
     if add_aging:
         img = add_aging_effect(img, intensity=0.6)  # 更强的磨损
-    
+
     img.save(output_path, "PNG")
     print(f"已转换: {input_path} -> {output_path}")
     print(f"目标颜色: RGB{target_rgb}")
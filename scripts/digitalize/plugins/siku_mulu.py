@@ -9,6 +9,7 @@
 - \\國朝         → \\相对抬头[1]{國朝}，展开为"國朝"并提升 indent
 """
 
+import functools
 import re
 import sys
 from pathlib import Path
@@ -17,6 +18,60 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from converter import ConverterPlugin, strip_punct, extract_brace_content
 
+# 按语中的抬头/分列命令：\相对抬头、\单抬、\平抬、\國朝，以及 \\（TeX 换行）。
+# 各命令第二个字符互不相同，同一位置至多一个能匹配，一次 search 即可找到最近的命令
+_TAITOU_RE = re.compile(r'\\(?:相对抬头|单抬|平抬|國朝|\\)')
+_BRACE_RE = re.compile(r'[{}]')
+_STYLE_HEAD_RE = re.compile(r'\\样式\[.*?\]\{')  # \样式[...]{ 包裹的头部
+# \注 内容需要后续处理的全部命令（\样式 包裹 + 抬头/分列命令），一次 search 判断有无
+_ZHU_CMD_RE = re.compile(r'\\(?:样式\[|相对抬头|单抬|平抬|國朝|\\)')
+
+
+@functools.lru_cache(maxsize=None)
+def _fallback_brace_re(cmd: str) -> re.Pattern:
+    """cmd{... 到文本末尾（花括号未闭合时的兜底提取），每个命令只编译一次"""
+    return re.compile(re.escape(cmd) + r'\{(.+)', re.DOTALL)
+
+
+def _strip_segments(segments: list[dict]) -> list[dict]:
+    """各段去标点（str.translate），同一遍里丢掉去标点后为空的段"""
+    kept = []
+    for seg in segments:
+        text = strip_punct(seg["text"])
+        if text:
+            seg["text"] = text
+            kept.append(seg)
+    return kept
+
+
+def _skip_ws(s: str, i: int) -> int:
+    """从 i 起跳过空白，返回第一个非空白字符的位置（等价于 lstrip，但不分配新字符串）"""
+    n = len(s)
+    while i < n and s[i].isspace():
+        i += 1
+    return i
+
+
+def _parse_reltaitou(s: str, start: int) -> tuple[int, str, int] | None:
+    """逐字符解析 \\相对抬头 之后的 [N]{text}（text 非空、不含换行、到第一个 } 为止）
+
+    返回 (N, text, end_pos)；格式不符返回 None
+    """
+    if not s.startswith('[', start):
+        return None
+    i = start + 1
+    j = i
+    n = len(s)
+    while j < n and s[j].isdecimal():
+        j += 1
+    if j == i or not s.startswith(']{', j):
+        return None
+    body = j + 2
+    close = s.find('}', body + 1)
+    if close == -1 or s.find('\n', body, close) != -1:
+        return None
+    return int(s[i:j]), s[body:close], close + 1
+
 
 class SikuMuluPlugin(ConverterPlugin):
     """四库全书简明目录专用插件"""
@@ -45,18 +100,18 @@ class SikuMuluPlugin(ConverterPlugin):
         # 收集完整的命令（可能跨行）
         full_text, consumed = self._collect_brace_content(lines, idx, '\\注')
 
-        # 处理 \样式 包裹的内容
-        full_text = self._strip_style_wrapper(full_text)
-
-        # 处理抬头命令（\國朝、\平抬、\单抬、\相对抬头、\\分列）
-        segments = self._process_taitou_commands(full_text, self.ZHU_INDENT)
+        if '\\' not in full_text or _ZHU_CMD_RE.search(full_text) is None:
+            # 常见情形：既无 \样式 也无抬头命令，一次扫描即可确定，跳过后续各遍处理
+            segments = [{"text": full_text, "indent_delta": 0}]
+        else:
+            # 处理 \样式 包裹的内容
+            full_text = self._strip_style_wrapper(full_text)
 
-        # 去标点
-        for seg in segments:
-            seg["text"] = strip_punct(seg["text"])
+            # 处理抬头命令（\國朝、\平抬、\单抬、\相对抬头、\\分列）
+            segments = self._process_taitou_commands(full_text, self.ZHU_INDENT)
 
-        # 过滤空段
-        segments = [s for s in segments if s["text"]]
+        # 去标点并过滤空段
+        segments = _strip_segments(segments)
 
         # 如果没有特殊分段，返回简单夹注
         if len(segments) == 1 and segments[0]["indent_delta"] == 0:
@@ -90,12 +145,8 @@ class SikuMuluPlugin(ConverterPlugin):
         # 处理抬头命令
         segments = self._process_taitou_commands(full_text, self.AN_INDENT)
 
-        # 去标点
-        for seg in segments:
-            seg["text"] = strip_punct(seg["text"])
-
-        # 过滤空段
-        segments = [s for s in segments if s["text"]]
+        # 去标点并过滤空段
+        segments = _strip_segments(segments)
 
         if len(segments) == 1 and segments[0]["indent_delta"] == 0:
             return [{
@@ -117,6 +168,11 @@ class SikuMuluPlugin(ConverterPlugin):
         """收集命令的花括号内容，支持跨行和嵌套花括号"""
         combined = ''
         consumed = 0
+        # 跨行保留扫描状态，每个字符只检查一次
+        cmd_pos = -1      # 命令位置
+        brace_start = -1  # 命令后第一个 { 的位置
+        scan_pos = 0      # 下一次查找/计数的起点
+        depth = 0
 
         for i in range(idx, len(lines)):
             combined += lines[i]
@@ -125,56 +181,72 @@ class SikuMuluPlugin(ConverterPlugin):
                 combined += '\n'
 
             # 检查花括号是否闭合（从命令后的第一个 { 开始计数）
-            cmd_pos = combined.find(cmd)
             if cmd_pos == -1:
-                continue
-            brace_start = combined.find('{', cmd_pos + len(cmd))
+                cmd_pos = combined.find(cmd, scan_pos)
+                if cmd_pos == -1:
+                    # 命令不含换行，不会跨越已扫描部分与新行
+                    scan_pos = len(combined)
+                    continue
+                scan_pos = cmd_pos + len(cmd)
             if brace_start == -1:
-                continue
+                brace_start = combined.find('{', scan_pos)
+                if brace_start == -1:
+                    scan_pos = len(combined)
+                    continue
+                scan_pos = brace_start
 
-            depth = 0
-            closed = False
-            for j in range(brace_start, len(combined)):
-                if combined[j] == '{':
+            for m in _BRACE_RE.finditer(combined, scan_pos):
+                if m.group() == '{':
                     depth += 1
-                elif combined[j] == '}':
+                else:
                     depth -= 1
                     if depth == 0:
                         # 提取内容
-                        content = combined[brace_start + 1:j]
+                        content = combined[brace_start + 1:m.start()]
                         return content.replace('\n', ''), consumed
+            scan_pos = len(combined)
             # 花括号未闭合，继续读取下一行
 
         # 未找到完整的花括号 — 尽力提取
-        m = re.search(re.escape(cmd) + r'\{(.+)', combined, re.DOTALL)
+        m = _fallback_brace_re(cmd).search(combined)
         if m:
             return m.group(1).rstrip('}').replace('\n', ''), consumed
         return '', consumed
 
     def _strip_style_wrapper(self, text: str) -> str:
-        """去除 \\样式[...]{content} 包裹，保留 content"""
-        # 处理多个 \样式 块
-        result = text
+        """去除 \\样式[...]{content} 包裹，保留 content
+
+        一遍扫描：记下每个包裹的头部和配对右花括号的位置，最后一次性切掉。
+        从头部之后继续扫描，嵌套在 content 里的 \\样式 也会被找到。
+        """
+        cuts = []  # 要删掉的 [start, end) 区间
+        pos = 0
         while True:
-            m = re.search(r'\\样式\[.*?\]\{', result)
+            m = _STYLE_HEAD_RE.search(text, pos)
             if not m:
                 break
-            # 找到匹配的右花括号
-            start = m.end()
-            depth = 1
-            end = start
-            for i in range(start, len(result)):
-                if result[i] == '{':
-                    depth += 1
-                elif result[i] == '}':
-                    depth -= 1
-                    if depth == 0:
-                        end = i
-                        break
-            # 替换为内容
-            inner = result[start:end]
-            result = result[:m.start()] + inner + result[end + 1:]
-        return result
+            brace = m.end() - 1
+            content, end = extract_brace_content(text, brace)
+            if len(content) == end - brace - 2:
+                # 花括号闭合：删头部和配对的右花括号
+                cuts.append((m.start(), m.end()))
+                cuts.append((end - 1, end))
+                pos = m.end()
+            else:
+                # 未闭合：与原先一样删掉头部及其后一个字符
+                cuts.append((m.start(), m.end() + 1))
+                pos = m.end() + 1
+        if not cuts:
+            return text
+
+        cuts.sort()
+        out = []
+        last = 0
+        for cut_start, cut_end in cuts:
+            out.append(text[last:cut_start])
+            last = cut_end
+        out.append(text[last:])
+        return ''.join(out)
 
     def _process_guochao(self, text: str) -> list[dict]:
         """处理 \\國朝 命令 → 展开为"國朝"，indent 提升 1"""
@@ -212,46 +284,31 @@ class SikuMuluPlugin(ConverterPlugin):
         返回的 segments 用 indent_delta（相对于 base_indent）。
         每个抬头命令产生的段落有 force_break=True，强制开始新的小列。
         """
-        # 注意：搜索顺序很重要，先搜索长命令再搜短命令
-        # \\ (TeX换行) 必须排在最后，因为其他命令都以 \ 开头
-        TAITOU_CMDS = ['\\相对抬头', '\\单抬', '\\平抬', '\\國朝']
-        ALL_CMDS = TAITOU_CMDS + ['\\\\']
-        if not any(cmd in text for cmd in ALL_CMDS):
+        # 所有命令都以 \ 开头：先用单字符查找排除最常见的无命令文本
+        if '\\' not in text or not _TAITOU_RE.search(text):
             return [{"text": text, "indent_delta": 0}]
 
         segments = []
-        remaining = text
         current_abs_indent = base_indent
+        pos = 0  # 尚未处理部分的起点（相当于原先的 remaining = text[pos:]）
+        n = len(text)
 
-        while remaining:
+        while pos < n:
             # 找最近的特殊命令
-            earliest_pos = len(remaining)
-            earliest_cmd = None
-
-            for cmd in ALL_CMDS:
-                pos = remaining.find(cmd)
-                if pos != -1 and pos < earliest_pos:
-                    earliest_pos = pos
-                    earliest_cmd = cmd
-            # 如果找到 \\，但该位置实际上是某个命令的前缀（如 \\单抬 中的 \\）
-            # 需要检查是否有更长的命令也从该位置开始
-            if earliest_cmd == '\\\\':
-                for cmd in TAITOU_CMDS:
-                    if remaining[earliest_pos:].startswith(cmd):
-                        earliest_cmd = cmd
-                        break
-
-            if earliest_cmd is None:
+            m = _TAITOU_RE.search(text, pos)
+
+            if m is None:
                 # 没有更多命令
-                if remaining.strip():
+                rest = text[pos:].strip()
+                if rest:
                     segments.append({
-                        "text": remaining.strip(),
+                        "text": rest,
                         "indent_delta": current_abs_indent - base_indent,
                     })
                 break
 
             # 命令前的文字
-            before = remaining[:earliest_pos].strip()
+            before = text[pos:m.start()].strip()
             if before:
                 segments.append({
                     "text": before,
@@ -259,31 +316,27 @@ class SikuMuluPlugin(ConverterPlugin):
                 })
 
             # 处理命令 — 每个抬头命令强制开始新小列
-            after_cmd = remaining[earliest_pos + len(earliest_cmd):]
+            cmd = m.group()
+            pos = _skip_ws(text, m.end())
 
-            if earliest_cmd == '\\单抬':
+            if cmd == '\\单抬':
                 current_abs_indent = -1
-                remaining = after_cmd.lstrip()
-            elif earliest_cmd == '\\平抬':
+            elif cmd == '\\平抬':
                 current_abs_indent = 0
-                remaining = after_cmd.lstrip()
-            elif earliest_cmd == '\\相对抬头':
-                m = re.match(r'\[(\d+)\]\{(.+?)\}', after_cmd.lstrip())
-                if m:
-                    n = int(m.group(1))
-                    taitou_text = m.group(2)
-                    target_indent = base_indent - n
+            elif cmd == '\\相对抬头':
+                args = _parse_reltaitou(text, pos)
+                if args:
+                    n_up, taitou_text, args_end = args
+                    target_indent = base_indent - n_up
                     segments.append({
                         "text": taitou_text,
                         "indent_delta": target_indent - base_indent,
                         "force_break": True,
                     })
-                    remaining = after_cmd.lstrip()[m.end():].lstrip()
+                    pos = _skip_ws(text, args_end)
                     current_abs_indent = target_indent
-                else:
-                    remaining = after_cmd.lstrip()
                 continue  # force_break 已在段落中标记
-            elif earliest_cmd == '\\國朝':
+            elif cmd == '\\國朝':
                 # \國朝 = \相对抬头[1]{國朝}
                 # 但在实际引擎中，夹注内 sr.get_indent() 可能返回不同值
                 # 实测 PDF 显示 \國朝 的 indent 与当前上下文相同（不变）
@@ -292,18 +345,15 @@ class SikuMuluPlugin(ConverterPlugin):
                     "indent_delta": current_abs_indent - base_indent,
                     "force_break": True,
                 })
-                remaining = after_cmd.lstrip()
                 # current_abs_indent 不变
                 continue
-            elif earliest_cmd == '\\\\':
-                # \\ = TeX 强制换行，在夹注中表示强制分列
-                # 不改变 indent，只强制开始新的小列
-                remaining = after_cmd.lstrip()
-                # 后续文字需要 force_break
+            # else: \\ = TeX 强制换行，在夹注中表示强制分列
+            # 不改变 indent，只强制开始新的小列
 
             # 对于 \单抬、\平抬、\\，后续第一个段落也需要 force_break
-            # 标记在下一轮循环的第一个 segment 中
-            if remaining.strip():
+            # 标记在下一轮循环的第一个 segment 中（pos 已跳过空白，
+            # pos < n 即后面还有非空白文字）
+            if pos < n:
                 # peek：下一轮循环产生的第一个 segment 需要 force_break
                 # 用一个特殊的空段落标记
                 segments.append({
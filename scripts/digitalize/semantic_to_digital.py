@@ -16,6 +16,8 @@ import importlib.util
 import json
 import re
 import sys
+from array import array
+from collections.abc import Sequence
 from pathlib import Path
 
 
@@ -34,6 +36,28 @@ DEFAULT_N_COLUMN = 8
 # 应该被去掉的 \usepackage 行
 REMOVE_USEPACKAGE = {"enumitem", "tikz"}
 
+# Parser 逐行调用的正则，预编译一次
+_CHAPTER_RE = re.compile(r'\\chapter\{(.+)\}')
+_YINZHANG_RE = re.compile(r'\\印章\s*\[')
+_PARAGRAPH_BEGIN_RE = re.compile(r'\\begin\{段落\}(\[.*?\])?')
+_TIAOMU_RE = re.compile(r'\\条目\[(\d+)\]\{(.+)\}')
+_JIAZHU_RE = re.compile(r'\\夹注\[.*?\]\{(.+?)\}')
+_ZHU_RE = re.compile(r'\\注\{')
+_AN_RE = re.compile(r'\\按\{')
+_CMD_NAME_RE = re.compile(r'\\(\S+?)[\[{\s]')
+_CMD_NAME_EOL_RE = re.compile(r'\\(\S+)$')
+_STYLE_LINE_RE = re.compile(r'\\样式\[.*?\]\{(.+)\}')
+_WHITESPACE_RE = re.compile(r'\s+')
+_YINZHANG_ARGS_RE = re.compile(r'\\印章\[(.+?)\]\{(.+?)\}')
+_INDENT_OPT_RE = re.compile(r'indent\s*=\s*(\d+)')
+_FIRST_INDENT_OPT_RE = re.compile(r'first-indent\s*=\s*(\d+)')
+_LINE_COMMENT_RE = re.compile(r'%.*$')
+
+# Generator._convert_preamble 逐行调用的正则
+_DOCCLASS_RE = re.compile(r'(\\documentclass)\[(.+?)\]\{(ltc-guji|guji)\}')
+_REMOVE_USEPACKAGE_RE = re.compile(
+    r'\\usepackage\{(' + '|'.join(map(re.escape, sorted(REMOVE_USEPACKAGE))) + r')\}')
+
 
 # =============================================================================
 # 插件基类
@@ -67,35 +91,83 @@ class ConverterPlugin:
 # 文本工具
 # =============================================================================
 
+_PUNCT_TABLE = str.maketrans('', '', PUNCTUATION)
+_BOOK_MARKER_TABLE = str.maketrans('', '', '《》')
+
+
 def strip_punct(text: str) -> str:
     """去除标点符号"""
-    return ''.join(c for c in text if c not in PUNCTUATION)
+    return text.translate(_PUNCT_TABLE)
 
 
 def strip_book_markers(text: str) -> str:
     """去除书名号《》"""
-    return text.replace('《', '').replace('》', '')
+    return text.translate(_BOOK_MARKER_TABLE)
 
 
 def char_len(text: str) -> int:
     """计算文字的显示字符数（一个中文字 = 1，忽略空格）"""
-    return len(text.replace(' ', ''))
+    return len(text) - text.count(' ')
+
+
+class LineView(Sequence):
+    """content.split('\\n') 的只读视图
+
+    只记录每行的起始偏移，按下标取行时才切片，不为整个文件物化一个子串列表。
+    Parser 与插件（context["lines"]）按 lines[i] / len(lines) 使用即可。
+    """
+
+    def __init__(self, content: str):
+        self._content = content
+        starts = array('q', [0])
+        find = content.find
+        pos = find('\n')
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+        self._starts = starts
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self._starts)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('line index out of range')
+        end = self._starts[i + 1] - 1 if i + 1 < n else len(self._content)
+        return self._content[self._starts[i]:end]
+
+
+def _match_delim(text: str, begin: int, open_ch: str, close_ch: str) -> tuple[str, int]:
+    """begin 为开分隔符之后的位置，用 str.find 跳到下一个分隔符，找到配对的闭分隔符。
+    返回 (content, end_pos)；未闭合时取到文本末尾"""
+    depth = 1
+    i = begin
+    find = text.find
+    while True:
+        c = find(close_ch, i)
+        if c == -1:
+            return text[begin:], len(text)
+        o = find(open_ch, i, c)
+        if o != -1:
+            depth += 1
+            i = o + 1
+            continue
+        depth -= 1
+        i = c + 1
+        if depth == 0:
+            return text[begin:c], i
 
 
 def extract_brace_content(text: str, start: int = 0) -> tuple[str, int]:
     """从 start 位置提取花括号内的内容，支持嵌套。返回 (content, end_pos)"""
     if start >= len(text) or text[start] != '{':
         return '', start
-    depth = 0
-    begin = start + 1
-    for i in range(start, len(text)):
-        if text[i] == '{':
-            depth += 1
-        elif text[i] == '}':
-            depth -= 1
-            if depth == 0:
-                return text[begin:i], i + 1
-    return text[begin:], len(text)
+    return _match_delim(text, start + 1, '{', '}')
 
 
 def load_patch_file(input_path: Path) -> list[dict]:
@@ -150,21 +222,13 @@ def load_patch_file(input_path: Path) -> list[dict]:
 
 def extract_optional_arg(text: str, start: int = 0) -> tuple[str | None, int]:
     """提取可选参数 [...]。返回 (content_or_None, end_pos)"""
-    s = text[start:].lstrip()
-    offset = len(text[start:]) - len(s)
-    pos = start + offset
-    if pos >= len(text) or text[pos] != '[':
+    n = len(text)
+    pos = start
+    while pos < n and text[pos].isspace():
+        pos += 1
+    if pos >= n or text[pos] != '[':
         return None, start
-    depth = 0
-    begin = pos + 1
-    for i in range(pos, len(text)):
-        if text[i] == '[':
-            depth += 1
-        elif text[i] == ']':
-            depth -= 1
-            if depth == 0:
-                return text[begin:i], i + 1
-    return text[begin:], len(text)
+    return _match_delim(text, pos + 1, '[', ']')
 
 
 # =============================================================================
@@ -252,18 +316,15 @@ class Parser:
         content = re.sub(r'\\begin\{(正文|BodyText)\}\s*', '', content, count=1)
         content = re.sub(r'\\end\{(正文|BodyText)\}\s*$', '', content, count=1)
 
-        lines = content.split('\n')
+        lines = LineView(content)
+        n_lines = len(lines)
         i = 0
-        while i < len(lines):
+        while i < n_lines:
             line = lines[i].rstrip()
 
             # 空行 → 跳过（guji 中空行是段落分隔符，不产生列）
-            if not line.strip():
-                i += 1
-                continue
-
             # 纯注释行 → 跳过
-            if line.strip().startswith('%'):
+            if not line or line.lstrip().startswith('%'):
                 i += 1
                 continue
 
@@ -285,7 +346,7 @@ class Parser:
         stripped = line.strip()
 
         # \chapter{...}
-        m = re.match(r'\\chapter\{(.+)\}', stripped)
+        m = _CHAPTER_RE.match(stripped)
         if m:
             self.blocks.append({"type": "chapter", "text": m.group(1)})
             return 1
@@ -296,24 +357,24 @@ class Parser:
             return 1
 
         # \印章[...]{...} — 可能跨行
-        m = re.match(r'\\印章\s*\[', stripped)
+        m = _YINZHANG_RE.match(stripped)
         if m:
             return self._parse_yinzhang(lines, idx)
 
         # \begin{段落}[...] ... \end{段落} — 多行块
-        m = re.match(r'\\begin\{段落\}(\[.*?\])?', stripped)
+        m = _PARAGRAPH_BEGIN_RE.match(stripped)
         if m:
             return self._parse_paragraph(lines, idx, m.group(1))
 
         # \条目[N]{text}
-        m = re.match(r'\\条目\[(\d+)\]\{(.+)\}', stripped)
+        m = _TIAOMU_RE.match(stripped)
         if m:
             level = int(m.group(1))
             text = m.group(2)
             # 去标点和书名号
             text = strip_punct(strip_book_markers(text))
             # 处理条目内的 \夹注
-            jiazhu_m = re.search(r'\\夹注\[.*?\]\{(.+?)\}', text)
+            jiazhu_m = _JIAZHU_RE.search(text)
             if jiazhu_m:
                 # 条目中有夹注，保留夹注内容为独立部分
                 main_text = text[:jiazhu_m.start()].strip()
@@ -323,7 +384,7 @@ class Parser:
             return 1
 
         # \注{...} — 等同于 indent=2 的夹注
-        m = re.match(r'\\注\{', stripped)
+        m = _ZHU_RE.match(stripped)
         if m:
             # 检查是否有 patch 匹配
             for patch in self.patches:
@@ -340,16 +401,16 @@ class Parser:
             return self._parse_zhu_or_an(lines, idx, "zhu", indent=2)
 
         # \按{...} — 等同于 indent=4 的夹注（可能跨多行）
-        m = re.match(r'\\按\{', stripped)
+        m = _AN_RE.match(stripped)
         if m:
             return self._parse_zhu_or_an(lines, idx, "an", indent=4)
 
         # 插件命令处理
         if self.plugin:
             # 检测命令名
-            cmd_m = re.match(r'\\(\S+?)[\[{\s]', stripped)
+            cmd_m = _CMD_NAME_RE.match(stripped)
             if not cmd_m:
-                cmd_m = re.match(r'\\(\S+)$', stripped)
+                cmd_m = _CMD_NAME_EOL_RE.match(stripped)
             if cmd_m:
                 cmd_name = cmd_m.group(1)
                 result = self.plugin.parse_command(cmd_name, stripped, {
@@ -368,7 +429,7 @@ class Parser:
             return 1
 
         # 以 \样式 开头的行（可能是独立文本行）
-        m = re.match(r'\\样式\[.*?\]\{(.+)\}', stripped)
+        m = _STYLE_LINE_RE.match(stripped)
         if m:
             text = strip_punct(strip_book_markers(m.group(1)))
             self.blocks.append({"type": "text", "text": text, "has_style": True})
@@ -402,9 +463,9 @@ class Parser:
         # 重新格式化为单行
         combined = combined.strip()
         # 简化印章参数（去掉换行和多余空格）
-        combined = re.sub(r'\s+', '', combined)
+        combined = _WHITESPACE_RE.sub('', combined)
         # 还原为可读格式
-        m = re.match(r'\\印章\[(.+?)\]\{(.+?)\}', combined)
+        m = _YINZHANG_ARGS_RE.match(combined)
         if m:
             opts = m.group(1)
             filename = m.group(2)
@@ -420,34 +481,29 @@ class Parser:
         first_indent = None
         if opts_str:
             # 解析 [indent=N, first-indent=M]
-            m = re.search(r'indent\s*=\s*(\d+)', opts_str)
+            m = _INDENT_OPT_RE.search(opts_str)
             if m:
                 indent = int(m.group(1))
-            m = re.search(r'first-indent\s*=\s*(\d+)', opts_str)
+            m = _FIRST_INDENT_OPT_RE.search(opts_str)
             if m:
                 first_indent = int(m.group(1))
 
-        # 收集段落内容
-        content_lines = []
+        # 收集段落内容并合并行（去掉行尾 % 注释）
+        parts = []
         consumed = 1  # \begin{段落} 行
         for i in range(idx + 1, len(lines)):
             consumed += 1
-            if '\\end{段落}' in lines[i]:
+            cl = lines[i]
+            if '\\end{段落}' in cl:
                 break
-            content_lines.append(lines[i])
-
-        # 合并行（去掉行尾 % 注释）
-        text = ''
-        for cl in content_lines:
             cl = cl.strip()
             if cl.startswith('%'):
                 continue
             # 去掉行尾 % 及之后的内容
-            cl = re.sub(r'%.*$', '', cl)
-            text += cl
+            parts.append(_LINE_COMMENT_RE.sub('', cl))
 
         # 去标点
-        text = strip_punct(text)
+        text = strip_punct(''.join(parts))
 
         if text:
             self.blocks.append({
@@ -628,183 +684,223 @@ class Layouter:
         self.n_char_per_col = n_char_per_col
         self.plugin = plugin
         self.n_column_per_page = n_column_per_page  # 每页的列数（左右合计）
+        self._handlers = {
+            "patch": self._layout_patch,
+            "chapter": self._layout_chapter,
+            "newpage": self._layout_newpage,
+            "yinzhang": self._layout_yinzhang,
+            "text": self._layout_text,
+            "tiaumu": self._layout_tiaumu,
+            "paragraph": self._layout_paragraph_block,
+            "jiazhu": self._layout_jiazhu,
+        }
 
     def layout(self, blocks: list[dict]) -> list[dict]:
         """将语义块列表转换为列数据列表，并在页面满时自动插入换页"""
         columns = []
         current_page_columns = 0  # 当前页已生成的列数
+        n_column_per_page = self.n_column_per_page
+        handlers = self._handlers
+        default = self._layout_other
+        n_blocks = len(blocks)
         i = 0
-        while i < len(blocks):
+        while i < n_blocks:
             block = blocks[i]
-            btype = block["type"]
-
-            # 存储本次迭代新增的列
-            new_cols = []
-
-            if btype == "patch":
-                # 手动 patch：直接插入预定义的 digital 行
-                for line in block["lines"]:
-                    new_cols.append({"type": "patch_line", "text": line})
-            elif btype == "chapter":
-                new_cols.append({"type": "chapter", "text": block["text"]})
-            elif btype == "newpage":
-                # 手动换页，重置计数器
-                new_cols.append({"type": "newpage"})
-                current_page_columns = 0
-            elif btype == "yinzhang":
-                new_cols.append({"type": "yinzhang", "raw": block["raw"]})
-            elif btype == "text":
-                new_cols.append({
-                    "type": "single",
-                    "indent": block.get("indent", 0),
-                    "text": block["text"],
-                })
-            elif btype == "tiaumu":
-                new_cols.append({
-                    "type": "single",
-                    "indent": block["level"],
-                    "text": block["text"],
-                    "source": "tiaumu",  # Mark source for Generator
-                })
-            elif btype == "paragraph":
-                new_cols = self._layout_paragraph(block)
-            elif btype == "jiazhu":
-                # 收集连续的 jiazhu 块，合并为统一的小列流
-                # 但如果当前块是 standalone，则不合并
-                if block.get("standalone", False):
-                    # 独立的 jiazhu 块，不与其他合并
-                    new_cols = self._layout_jiazhu_run([block])
-                else:
-                    # 收集连续的非 standalone jiazhu 块
-                    jiazhu_run = [block]
-                    j = i + 1
-                    while j < len(blocks) and blocks[j]["type"] == "jiazhu" and not blocks[j].get("standalone", False):
-                        jiazhu_run.append(blocks[j])
-                        j += 1
-                    new_cols = self._layout_jiazhu_run(jiazhu_run)
-                    i = j - 1  # 跳过已消耗的块（外层 i += 1 会再加1）
-            else:
-                if "text" in block:
-                    new_cols.append({
-                        "type": "single",
-                        "indent": block.get("indent", 0),
-                        "text": block["text"],
-                    })
+            # 按块类型查表分派；处理函数返回新增的列与下一个块的下标
+            new_cols, i = handlers.get(block["type"], default)(block, blocks, i)
 
             # 添加新列并检查是否需要换页
             for col in new_cols:
+                ctype = col["type"]
+                if ctype == "newpage":
+                    # 手动换页，重置计数器
+                    columns.append(col)
+                    current_page_columns = 0
+                    continue
+
                 # 计算本列的实际列数（dual 类型算 1 列，single 类型也算 1 列）
-                col_count = 1
-                if col["type"] in ("chapter", "yinzhang"):
-                    col_count = 0  # 不占用列数
+                col_count = 0 if ctype in ("chapter", "yinzhang") else 1  # chapter/yinzhang 不占用列数
 
                 # 检查是否会超出当前页
-                if current_page_columns > 0 and current_page_columns + col_count > self.n_column_per_page:
+                if current_page_columns > 0 and current_page_columns + col_count > n_column_per_page:
                     # 需要换页
                     columns.append({"type": "newpage"})
                     current_page_columns = 0
 
                 columns.append(col)
-                if col["type"] == "newpage":
-                    current_page_columns = 0
-                else:
-                    current_page_columns += col_count
-
-            i += 1
+                current_page_columns += col_count
 
         return columns
 
+    def _layout_patch(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        """手动 patch：直接插入预定义的 digital 行"""
+        return [{"type": "patch_line", "text": line} for line in block["lines"]], i + 1
+
+    def _layout_chapter(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return [{"type": "chapter", "text": block["text"]}], i + 1
+
+    def _layout_newpage(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return [{"type": "newpage"}], i + 1
+
+    def _layout_yinzhang(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return [{"type": "yinzhang", "raw": block["raw"]}], i + 1
+
+    def _layout_text(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return [{
+            "type": "single",
+            "indent": block.get("indent", 0),
+            "text": block["text"],
+        }], i + 1
+
+    def _layout_tiaumu(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return [{
+            "type": "single",
+            "indent": block["level"],
+            "text": block["text"],
+            "source": "tiaumu",  # Mark source for Generator
+        }], i + 1
+
+    def _layout_paragraph_block(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        return self._layout_paragraph(block), i + 1
+
+    def _layout_jiazhu(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        """收集连续的 jiazhu 块，合并为统一的小列流
+        但如果当前块是 standalone，则不合并"""
+        if block.get("standalone", False):
+            # 独立的 jiazhu 块，不与其他合并
+            return self._layout_jiazhu_run([block]), i + 1
+        # 收集连续的非 standalone jiazhu 块
+        jiazhu_run = [block]
+        j = i + 1
+        while j < len(blocks) and blocks[j]["type"] == "jiazhu" and not blocks[j].get("standalone", False):
+            jiazhu_run.append(blocks[j])
+            j += 1
+        return self._layout_jiazhu_run(jiazhu_run), j
+
+    def _layout_other(self, block: dict, blocks: list[dict], i: int) -> tuple[list[dict], int]:
+        """未知类型：有 text 则按单列输出"""
+        if "text" not in block:
+            return [], i + 1
+        return [{
+            "type": "single",
+            "indent": block.get("indent", 0),
+            "text": block["text"],
+        }], i + 1
+
     def _layout_paragraph(self, block: dict) -> list[dict]:
         """段落 → 按每列可用字数切分为多列"""
         text = block["text"]
         indent = block["indent"]
         first_indent = block.get("first_indent", indent)
-        columns = []
+        if not text:
+            return []
 
+        # 首列可能缩进不同，单独切出；其余各列等宽，按步长一次切完
+        columns = []
         pos = 0
-        is_first = True
-        while pos < len(text):
-            cur_indent = first_indent if is_first else indent
-            chars_per_col = self.n_char_per_col - cur_indent
-            chunk = text[pos:pos + chars_per_col]
+        if first_indent != indent:
+            first_width = self.n_char_per_col - first_indent
             columns.append({
                 "type": "single",
-                "indent": cur_indent,
-                "text": chunk,
+                "indent": first_indent,
+                "text": text[:first_width],
             })
-            pos += chars_per_col
-            is_first = False
+            pos = first_width
 
-        return columns
-
-    def _layout_jiazhu_run(self, jiazhu_blocks: list[dict]) -> list[dict]:
-        """
-        将连续的 jiazhu 块合并为统一的小列流，然后分栏。
+        chars_per_col = self.n_char_per_col - indent
+        columns.extend({
+            "type": "single",
+            "indent": indent,
+            "text": text[p:p + chars_per_col],
+        } for p in range(pos, len(text), chars_per_col))
 
-        小列流 = [(text, indent, force_break), ...]，每个元素是一个"段落"，
-        其 indent 决定该段文字在小列中的 chars_per_subcol。
-        force_break=True 表示该段必须开始一个新的小列。
-        """
-        # Step 1: 展开所有 jiazhu 块为统一的分段流
-        all_segments = []  # [(text, absolute_indent, force_break)]
+        return columns
 
+    @staticmethod
+    def _iter_segments(jiazhu_blocks: list[dict]):
+        """展开 jiazhu 块为统一的分段流，逐段 yield (text, absolute_indent, force_break)，跳过空段"""
         for block in jiazhu_blocks:
             base_indent = block["indent"]
             segments = block.get("segments", None)
 
             if segments:
                 for seg in segments:
-                    delta = seg.get("indent_delta", 0)
-                    actual_indent = base_indent + delta
-                    force_break = seg.get("force_break", False)
                     if seg["text"]:
-                        all_segments.append((seg["text"], actual_indent, force_break))
-            else:
-                if block.get("text"):
-                    all_segments.append((block["text"], base_indent, False))
-
-        if not all_segments:
-            return []
-
-        # Step 2: 逐小列填充
-        # 每个小列有自己的 indent，从第一个未消耗的段落的 indent 决定
+                        yield (seg["text"], base_indent + seg.get("indent_delta", 0),
+                               seg.get("force_break", False))
+            elif block.get("text"):
+                yield (block["text"], base_indent, False)
+
+    def _fill_subcols(self, jiazhu_blocks: list[dict]) -> list[tuple[str, int]]:
+        """按分段流逐小列填充，返回 [(text, indent)]"""
+        # Step 1 + 2: 分段流由 _iter_segments 逐段产生，边取边填充小列，
+        # 不先展开成完整的分段列表
+        # 每个小列有自己的 indent，从第一个未消耗的段落的 indent 决定。
+        # 这是 jiazhu 多的书里最热的循环：属性和长度都取到局部变量，
+        # 一段剩余文字放得下时整段取走，放不下时切满本小列后直接结束。
         subcols = []  # [(text, indent)]  每个小列
-        seg_idx = 0
-        seg_pos = 0  # 当前段落内的字符位置
+        segs = self._iter_segments(jiazhu_blocks)
+        seg = next(segs, None)
+        if seg is None:
+            return subcols
 
-        while seg_idx < len(all_segments):
-            seg_text, seg_indent, seg_force = all_segments[seg_idx]
-            if seg_pos >= len(seg_text):
-                seg_idx += 1
-                seg_pos = 0
-                continue
+        n_char_per_col = self.n_char_per_col
+        seg_text, seg_indent, _ = seg
+        seg_pos = 0  # 当前段落内的字符位置
 
+        while seg is not None:
             # 本小列的 indent = 当前段落的 indent
             col_indent = seg_indent
-            chars_per_subcol = self.n_char_per_col - col_indent
-
-            # 填充本小列
-            col_text = ''
-            remaining = chars_per_subcol
+            remaining = n_char_per_col - col_indent
+            if len(seg_text) - seg_pos > remaining:
+                # 整个小列都落在当前段内（长段中间的各列）：直接切片，不经 frags
+                subcols.append((seg_text[seg_pos:seg_pos + remaining], col_indent))
+                seg_pos += remaining
+                continue
 
-            while remaining > 0 and seg_idx < len(all_segments):
-                seg_text, seg_indent, seg_force = all_segments[seg_idx]
+            # 填充本小列（片段先收进列表，满列后一次 join）
+            frags = []
+            while remaining > 0:
                 available = len(seg_text) - seg_pos
-                take = min(remaining, available)
-                col_text += seg_text[seg_pos:seg_pos + take]
-                seg_pos += take
-                remaining -= take
-
-                if seg_pos >= len(seg_text):
-                    seg_idx += 1
-                    seg_pos = 0
-                    # 如果还有剩余空间且下一段需要强制分列或 indent 不同，停止填充
-                    if remaining > 0 and seg_idx < len(all_segments):
-                        next_text, next_indent, next_force = all_segments[seg_idx]
-                        if next_indent != col_indent or next_force:
-                            break
-
-            subcols.append((col_text, col_indent))
+                if available > remaining:
+                    frags.append(seg_text[seg_pos:seg_pos + remaining])
+                    seg_pos += remaining
+                    break
+                frags.append(seg_text[seg_pos:] if seg_pos else seg_text)
+                remaining -= available
+                seg = next(segs, None)
+                seg_pos = 0
+                if seg is None:
+                    break
+                seg_text, seg_indent, next_force = seg
+                # 如果还有剩余空间且下一段需要强制分列或 indent 不同，停止填充
+                if remaining > 0 and (seg_indent != col_indent or next_force):
+                    break
+
+            subcols.append((''.join(frags), col_indent))
+
+        return subcols
+
+    def _layout_jiazhu_run(self, jiazhu_blocks: list[dict]) -> list[dict]:
+        """
+        将连续的 jiazhu 块合并为统一的小列流，然后分栏。
+
+        小列流 = [(text, indent, force_break), ...]，每个元素是一个"段落"，
+        其 indent 决定该段文字在小列中的 chars_per_subcol。
+        force_break=True 表示该段必须开始一个新的小列。
+        """
+        indent = jiazhu_blocks[0]["indent"]
+        width = self.n_char_per_col - indent
+        if width > 0 and all(not b.get("segments") and b["indent"] == indent
+                             for b in jiazhu_blocks):
+            # 最常见的情形：都是无分段的普通夹注且 indent 相同，不会有强制分列，
+            # 整串文字按小列宽度等距切开即可，不必走分段流
+            text = ''.join(b.get("text") or '' for b in jiazhu_blocks)
+            subcols = [(text[p:p + width], indent) for p in range(0, len(text), width)]
+        else:
+            subcols = self._fill_subcols(jiazhu_blocks)
+        if not subcols:
+            return []
 
         # Step 3: 每两个小列组成一个大列
         columns = []
@@ -841,21 +937,23 @@ class Generator:
         self.plugin = plugin
 
     def generate(self, preamble: str, preserved_before: str, columns: list[dict],
-                 preserved_after: str, footer: str) -> str:
-        """生成完整的 digital TeX 文件"""
-        parts = []
+                 preserved_after: str, footer: str):
+        """生成完整的 digital TeX 文件
 
+        逐行 yield（每行带换行符），调用方边生成边写文件，
+        不必先在内存里拼出整个输出。
+        """
         # 转换 preamble
-        parts.append(self._convert_preamble(preamble))
-        parts.append('')
+        yield self._convert_preamble(preamble) + '\n'
+        yield '\n'
 
         # 前置环境（\begin{正文} 之前的封面、书名页）
         if preserved_before.strip():
-            parts.append(preserved_before.rstrip())
-            parts.append('')
+            yield preserved_before.rstrip() + '\n'
+            yield '\n'
 
         # 正文环境 (ltc-guji-digital 中自动启用 digital-mode)
-        parts.append('\\begin{正文}')
+        yield '\\begin{正文}\n'
 
         # 第一个 chapter 也在正文环境内输出（避免在环境外触发换页产生空白页）
         first_chapter = None
@@ -865,7 +963,7 @@ class Generator:
                 break
 
         if first_chapter:
-            parts.append(f'\\chapter{{{first_chapter}}}')
+            yield f'\\chapter{{{first_chapter}}}\n'
 
         # 生成列
         chapter_count = 0
@@ -879,21 +977,21 @@ class Generator:
                     continue
                 # 后续 chapter：直接在 \正文 环境内输出
                 # digital 模式下 \chapter 在环境内可正常工作，不需要关闭再重开
-                parts.append(f'\\chapter{{{col["text"]}}}')
+                yield f'\\chapter{{{col["text"]}}}\n'
                 continue
 
             if ctype == "newpage":
                 # 直接输出换页命令，保留原文件的所有换页
-                parts.append('\\换页')
+                yield '\\换页\n'
                 continue
 
             if ctype == "yinzhang":
-                parts.append(col["raw"] + '%')
+                yield col["raw"] + '%\n'
                 continue
 
             if ctype == "patch_line":
                 # 手动 patch 行：直接输出预定义的内容
-                parts.append(col["text"])
+                yield col["text"] + '\n'
                 continue
 
             if ctype == "single":
@@ -907,77 +1005,76 @@ class Generator:
                 if source == "tiaumu":
                     # 条目: output actual full-width spaces
                     indent_str = '　' * indent
-                    parts.append(f'{indent_str}{text}')
+                    yield f'{indent_str}{text}\n'
                 else:
                     # 段落: use \缩进[N] command
                     if indent != 0:
-                        parts.append(f'\\缩进[{indent}] {text}')
+                        yield f'\\缩进[{indent}] {text}\n'
                     else:
-                        parts.append(text)
+                        yield text + '\n'
                 continue
 
             if ctype == "dual":
                 indent = col.get("indent", 0)
                 right = col.get("right", "")
                 left = col.get("left", "")
-                r_opt = f'[indent={col["right_indent"]}]' if col.get("right_indent") is not None else ''
-                l_opt = f'[indent={col["left_indent"]}]' if col.get("left_indent") is not None else ''
-                # Use \缩进[N] command (always output, even if N=0) for explicit indent control
+                right_indent = col.get("right_indent")
+                left_indent = col.get("left_indent")
+                if indent == 0 and right_indent is None and left_indent is None:
+                    # 最常见的情形：无缩进、小列无单独 indent
+                    yield f'\\双列{{\\右小列{{{right}}}\\左小列{{{left}}}}}\n'
+                    continue
+                r_opt = '' if right_indent is None else f'[indent={right_indent}]'
+                l_opt = '' if left_indent is None else f'[indent={left_indent}]'
+                # Use \缩进[N] command (only when N != 0) for explicit indent control
                 prefix = f'\\缩进[{indent}]' if indent != 0 else ''
-                line = f'{prefix}\\双列{{\\右小列{r_opt}{{{right}}}\\左小列{l_opt}{{{left}}}}}'
-                parts.append(line)
+                yield f'{prefix}\\双列{{\\右小列{r_opt}{{{right}}}\\左小列{l_opt}{{{left}}}}}\n'
                 continue
 
-        parts.append('')
-        parts.append('\\end{正文}')
+        yield '\n'
+        yield '\\end{正文}\n'
 
         # 后置环境（\end{正文} 之后的封面、空白页）
         if preserved_after.strip():
-            parts.append(preserved_after.rstrip())
-
-        parts.append(footer.rstrip())
-        parts.append('')
+            yield preserved_after.rstrip() + '\n'
 
-        return '\n'.join(parts)
+        yield footer.rstrip() + '\n'
 
     def _convert_preamble(self, preamble: str) -> str:
         """转换文档头"""
-        lines = preamble.split('\n')
         result = []
+        prev_empty = False
 
-        for line in lines:
+        for line in preamble.split('\n'):
             # documentclass 替换：只替换 class 名，保留原模板名
             # 例：\documentclass[四库全书文渊阁简明目录]{ltc-guji}
             #  → \documentclass[四库全书文渊阁简明目录]{ltc-guji-digital}
-            m = re.match(r'(\\documentclass)\[(.+?)\]\{(ltc-guji|guji)\}', line)
+            m = _DOCCLASS_RE.match(line)
             if m:
                 template_name = m.group(2)
                 # 直接保留原模板名，不做映射
                 result.append(f'\\documentclass[{template_name}]{{ltc-guji-digital}}')
+                prev_empty = False
                 continue
 
+            stripped = line.strip()
+
             # 去掉不需要的 \usepackage
-            if re.match(r'\\usepackage\{(' + '|'.join(REMOVE_USEPACKAGE) + r')\}', line.strip()):
+            if _REMOVE_USEPACKAGE_RE.match(stripped):
                 continue
 
             # 去掉纯注释行
-            if line.strip().startswith('%'):
+            if stripped.startswith('%'):
                 continue
 
-            # 保留其他行
-            result.append(line)
-
-        # 去掉连续空行（保留最多一个空行）
-        cleaned = []
-        prev_empty = False
-        for line in result:
-            is_empty = not line.strip()
+            # 去掉连续空行（保留最多一个空行），其他行保留
+            is_empty = not stripped
             if is_empty and prev_empty:
                 continue
-            cleaned.append(line)
+            result.append(line)
             prev_empty = is_empty
 
-        return '\n'.join(cleaned)
+        return '\n'.join(result)
 
 
 # =============================================================================
@@ -1021,14 +1118,14 @@ def convert(input_path: str, output_path: str, plugin_path: str | None = None,
         plugin = load_plugin(plugin_path)
         print(f"已加载插件: {plugin_path}")
 
-    # 读取输入文件
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    # 读取输入文件（一次读入整个文件）
+    input_path = Path(input_path)
+    content = input_path.read_text(encoding='utf-8')
 
     print(f"读取输入: {input_path} ({len(content)} 字符)")
 
     # 加载 patch 文件（如果存在）
-    patches = load_patch_file(Path(input_path))
+    patches = load_patch_file(input_path)
 
     # Stage 1: 解析
     parser = Parser(plugin=plugin, n_char_per_col=n_char_per_col, patches=patches)
@@ -1050,12 +1147,14 @@ def convert(input_path: str, output_path: str, plugin_path: str | None = None,
 
     # Stage 3: 生成
     generator = Generator(plugin=plugin)
-    output = generator.generate(preamble, preserved_before, columns, preserved_after, footer)
-    print(f"Stage 3 完成: 输出 {len(output)} 字符")
-
-    # 写入输出文件
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(output)
+    # 边生成边写入输出文件；加大缓冲区，减少逐行写入的系统调用
+    n_chars = 0
+    with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        for line in generator.generate(preamble, preserved_before, columns,
+                                       preserved_after, footer):
+            f.write(line)
+            n_chars += len(line)
+    print(f"Stage 3 完成: 输出 {n_chars} 字符")
 
     print(f"已写入: {output_path}")
 
@@ -3,23 +3,152 @@
 image_compare.py — Shared image comparison utilities for luatex-cn.
 
 Provides:
-  - pdf_to_pngs(pdf_file, output_dir, dpi=300)  → list[Path]
+  - pdf_to_pngs(pdf_file, output_dir, dpi=300, chunks=1)  → list[Path]
+  - pdfs_to_pngs(pdf_files, output_dirs, dpi=300, chunks=1) → list[list[Path]]
+  - pdf_page_count(pdf_file)                    → int
+  - find_pages(directory, stem, ext="png")      → list[Path] (<stem>-N.<ext>, by N)
+  - start_render_pages(pdf_file, output_dir, first, last, dpi=300, ext="png", n_pages=None)
+        → wait() → list[Path]
   - compare_images(baseline_png, current_png, diff_png) → int (diff pixel count)
+  - compare_page_batch(baseline_pngs, current_pngs, diff_pngs=None) → list of
+    compare_images results, pages compared concurrently
+  - files_identical(a, b)                      → bool (byte-equal files)
+  - load_rgb_cached(png, cache_dir)            → array (decoded .npy cache, memory-mapped)
+  - load_rgb(png) / compare_arrays(baseline_arr, current_arr) — the same
+    comparison on decoded pixel arrays, for callers that keep them in memory
 
 Used by:
   - test/regression_test.py
   - scripts/compare_pdfs.py
 """
 
+import concurrent.futures
+import filecmp
+import glob
+import os
 import re
 import subprocess
+import threading
 from pathlib import Path
 
 from PIL import Image
 import numpy as np
 
+# Decoded 300-DPI pages are ~25 MB each. When several documents are compared
+# at once (regression_test runs files on threads, each with its own page
+# pool), this caps how many page pairs are decoded and compared at the same
+# time across all of them; more than one per CPU only adds memory.
+_COMPARE_SLOTS = threading.BoundedSemaphore(os.cpu_count() or 1)
 
-def pdf_to_pngs(pdf_file: Path, output_dir: Path, dpi: int = 300) -> list:
+
+def _numbered_pages(directory: Path, stem: str, ext: str = "png") -> list:
+    """(N, path) for each <stem>-N.<ext> in *directory*, sorted by N."""
+    # Only the exact stem followed by -N.png counts (not stem-more-stuff-N.png),
+    # e.g. "guji-*.png" must not match "guji-digital-basic-1.png". The number
+    # is sliced out of the name, no regex needed. scandir + plain string tests
+    # only build a Path for the matches, which matters in a baseline directory
+    # holding thousands of pages.
+    directory = Path(directory)
+    prefix, suffix = f"{stem}-", f".{ext}"
+    start, end = len(prefix), -len(suffix)
+    pages = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith(prefix) and name.endswith(suffix):
+                    num = name[start:end]
+                    if num.isascii() and num.isdigit():
+                        pages.append((int(num), directory / name))
+    except FileNotFoundError:
+        return []
+    pages.sort()
+    return pages
+
+
+def find_pages(directory: Path, stem: str, ext: str = "png") -> list:
+    """Existing <stem>-N.<ext> page images in *directory*, sorted by N."""
+    return [f for _, f in _numbered_pages(directory, stem, ext)]
+
+
+def _pdftoppm_cmd(pdf_file: Path, output_dir: Path, dpi: int,
+                  first: int | None = None, last: int | None = None,
+                  ext: str = "png") -> list:
+    # pdftoppm writes PPM unless told otherwise
+    cmd = ["pdftoppm"] + ([] if ext == "ppm" else [f"-{ext}"]) + ["-r", str(dpi)]
+    if first is not None:
+        cmd += ["-f", str(first), "-l", str(last)]
+    return cmd + [str(pdf_file), str(output_dir / pdf_file.stem)]
+
+
+def pdf_page_count(pdf_file: Path) -> int:
+    """Number of pages in a PDF (via pdfinfo), or 0 if it cannot be read."""
+    result = subprocess.run(["pdfinfo", str(pdf_file)], capture_output=True, text=True)
+    m = re.search(r"^Pages:\s+(\d+)", result.stdout, re.MULTILINE)
+    if result.returncode != 0 or not m:
+        print(f"ERROR: Could not read page count of {Path(pdf_file).name}")
+        print(result.stderr)
+        return 0
+    return int(m.group(1))
+
+
+def _expected_pages(output_dir: Path, stem: str, first: int, last: int,
+                    n_pages: int, ext: str = "png") -> list:
+    """The files pdftoppm writes for pages first..last of an n_pages PDF.
+
+    pdftoppm zero-pads page numbers to the width of the document's page
+    count (not of the rendered range), so the names are known up front.
+    """
+    digits = len(str(n_pages))
+    return [output_dir / f"{stem}-{n:0{digits}d}.{ext}" for n in range(first, last + 1)]
+
+
+def start_render_pages(pdf_file: Path, output_dir: Path, first: int | None,
+                       last: int | None, dpi: int = 300, ext: str = "png",
+                       n_pages: int | None = None):
+    """Start rendering pages first..last (1-based, inclusive) of a PDF to PNG.
+
+    pdftoppm runs in the background, so a caller can render the next slice
+    of a long PDF while it works on the current one. Returns a function that
+    waits for it and returns the PNGs of that range in page order, or an
+    empty list if conversion fails. first=last=None renders every page.
+
+    ext="ppm" writes uncompressed pages, which skips the PNG zlib round trip
+    for renders that are only decoded once and then thrown away.
+
+    When the PDF's page count is passed as *n_pages*, the output names are
+    built directly instead of scanning *output_dir* for them.
+    """
+    pdf_file = Path(pdf_file)
+    output_dir = Path(output_dir)
+    proc = subprocess.Popen(
+        _pdftoppm_cmd(pdf_file, output_dir, dpi, first, last, ext),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    def wait() -> list:
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            pages = "" if first is None else f" (pages {first}-{last})"
+            print(f"ERROR: PDF to PNG conversion failed for {pdf_file.name}{pages}")
+            print(stderr)
+            return []
+        if n_pages:
+            expected = _expected_pages(output_dir, pdf_file.stem, first or 1,
+                                       n_pages if last is None else last, n_pages, ext)
+            if all(f.exists() for f in expected):
+                return expected
+        if first is None:
+            return find_pages(output_dir, pdf_file.stem, ext)
+        return [f for n, f in _numbered_pages(output_dir, pdf_file.stem, ext)
+                if first <= n <= last]
+
+    return wait
+
+
+def pdf_to_pngs(pdf_file: Path, output_dir: Path, dpi: int = 300, chunks: int = 1) -> list:
     """Convert all pages of a PDF to PNG images using pdftoppm.
 
     Existing images for this PDF stem are removed before conversion.
@@ -28,41 +157,53 @@ def pdf_to_pngs(pdf_file: Path, output_dir: Path, dpi: int = 300) -> list:
         pdf_file:   Path to the PDF file.
         output_dir: Directory where PNG files will be written.
         dpi:        Resolution in dots per inch (default 300).
+        chunks:     Number of pdftoppm processes to split the pages across.
 
     Returns:
         Sorted list of Path objects for the generated PNG files,
         or an empty list if conversion fails.
     """
-    output_dir = Path(output_dir)
-    pdf_file = Path(pdf_file)
+    return pdfs_to_pngs([pdf_file], [output_dir], dpi=dpi, chunks=chunks)[0]
 
-    # Clean up old images for this file (use regex to avoid matching longer stems,
-    # e.g. "guji-*.png" must not delete "guji-digital-basic-1.png")
-    for old_png in output_dir.glob(f"{pdf_file.stem}-*.png"):
-        if re.match(rf"^{re.escape(pdf_file.stem)}-\d+\.png$", old_png.name):
-            old_png.unlink()
 
-    output_prefix = str(output_dir / pdf_file.stem)
-    result = subprocess.run(
-        ["pdftoppm", "-png", "-r", str(dpi), str(pdf_file), output_prefix],
-        capture_output=True,
-        text=True,
-    )
-    if result.returncode != 0:
-        print(f"ERROR: PDF to PNG conversion failed for {pdf_file.name}")
-        print(result.stderr)
-        return []
+def pdfs_to_pngs(pdf_files: list, output_dirs: list, dpi: int = 300, chunks: int = 1) -> list:
+    """Convert several PDFs at once, with concurrent pdftoppm processes.
 
-    # Use regex to match exact stem followed by -N.png (not stem-more-stuff-N.png)
-    pngs = sorted(
-        [f for f in output_dir.glob(f"{pdf_file.stem}-*.png")
-         if re.match(rf"^{re.escape(pdf_file.stem)}-\d+\.png$", f.name)],
-        key=lambda x: int(re.search(r"-(\d+)\.png$", x.name).group(1)),
-    )
-    return pngs
+    Same contract as pdf_to_pngs, applied pairwise to *pdf_files* and
+    *output_dirs*; returns one PNG list per PDF (empty on failure).
+    Rendering both sides of a comparison concurrently overlaps the
+    renderer start-up and font loading instead of paying it twice in a row.
+    pdftoppm itself is single-threaded, so with chunks > 1 each PDF's pages
+    are split into that many -f/-l ranges, each rendered by its own process.
+    """
+    pdf_files = [Path(p) for p in pdf_files]
+    output_dirs = [Path(d) for d in output_dirs]
+
+    pending = []  # per PDF: wait() functions for its page ranges
+    for pdf_file, output_dir in zip(pdf_files, output_dirs):
+        # Clean up old images for this file
+        for old_png in find_pages(output_dir, pdf_file.stem):
+            old_png.unlink()
+        n_pages = pdf_page_count(pdf_file) if chunks > 1 else 0
+        if n_pages > 1:
+            step = -(-n_pages // min(chunks, n_pages))
+            pending.append([
+                start_render_pages(pdf_file, output_dir, first,
+                                   min(first + step - 1, n_pages), dpi, n_pages=n_pages)
+                for first in range(1, n_pages + 1, step)
+            ])
+        else:
+            pending.append([start_render_pages(pdf_file, output_dir, None, None, dpi)])
+
+    results = []
+    for waits in pending:
+        parts = [wait() for wait in waits]
+        results.append([] if not all(parts) else [png for part in parts for png in part])
+    return results
 
 
-def compare_images(baseline_png: Path, current_png: Path, diff_png: Path) -> tuple[int, int]:
+def compare_images(baseline_png: Path, current_png: Path, diff_png: Path | None,
+                   baseline_cache: Path | None = None) -> tuple[int, int]:
     """Compare two PNG images and generate a composite diff image.
 
     Composite colouring:
@@ -71,12 +212,16 @@ def compare_images(baseline_png: Path, current_png: Path, diff_png: Path) -> tup
       - Current-only      → red tint
       - Both differ       → mixed (purple/dark)
 
-    The diff image is written to *diff_png* only when differences exist.
+    The diff image is written to *diff_png* only when differences exist;
+    pass diff_png=None when only the counts are needed, which also skips
+    building the composite.
 
     Args:
         baseline_png: Path to the baseline PNG.
         current_png:  Path to the current PNG.
         diff_png:     Path where the diff image will be saved.
+        baseline_cache: Optional directory of decoded baselines; when given,
+                      the baseline is read via load_rgb_cached.
 
     Returns:
         (diff_count, pixel_count, structural_count)
@@ -89,27 +234,114 @@ def compare_images(baseline_png: Path, current_png: Path, diff_png: Path) -> tup
             layout/glyph change flips ink presence somewhere. Callers may
             treat diff_count > 0 with structural_count == 0 as ignorable.
     """
-    baseline_img = Image.open(baseline_png).convert("RGB")
-    current_img = Image.open(current_png).convert("RGB")
-
-    # Ensure same size (pad the smaller image with white)
-    w = max(baseline_img.width, current_img.width)
-    h = max(baseline_img.height, current_img.height)
-    if baseline_img.size != (w, h):
-        padded = Image.new("RGB", (w, h), (255, 255, 255))
-        padded.paste(baseline_img, (0, 0))
-        baseline_img = padded
-    if current_img.size != (w, h):
-        padded = Image.new("RGB", (w, h), (255, 255, 255))
-        padded.paste(current_img, (0, 0))
-        current_img = padded
-
-    baseline_arr = np.array(baseline_img)
-    current_arr = np.array(current_img)
+    if files_identical(baseline_png, current_png):
+        # Byte-identical PNGs cannot differ in any pixel; only the header is read
+        w, h = Image.open(baseline_png).size
+        return 0, w * h, 0
+    with _COMPARE_SLOTS:
+        baseline_arr = (load_rgb(baseline_png) if baseline_cache is None
+                        else load_rgb_cached(baseline_png, baseline_cache))
+        diff_count, pixel_count, structural_count, diff = compare_arrays(
+            baseline_arr, load_rgb(current_png), want_diff=diff_png is not None)
+        if diff is not None:
+            Image.fromarray(diff).save(str(diff_png))
+    return diff_count, pixel_count, structural_count
+
+
+def compare_page_batch(baseline_pngs: list, current_pngs: list, diff_pngs: list | None = None,
+                       baseline_cache: Path | None = None, workers: int = 4) -> list:
+    """compare_images over page pairs, returning one result tuple per pair.
+
+    Byte-identical pairs are answered from the header alone; the rest are
+    decoded and compared on up to *workers* threads (PNG decoding and the
+    NumPy work release the GIL), with at most one page pair per CPU decoded
+    at any moment across all concurrent batches. Pages are not stacked into one array: at
+    300 DPI that would hold every page of a document in memory at once.
+    diff_pngs=None only counts, as compare_images(..., None) does.
+    """
+    n = len(current_pngs)
+    if not n:
+        return []
+    if diff_pngs is None:
+        diff_pngs = [None] * n
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, n)) as pool:
+        return list(pool.map(compare_images, baseline_pngs, current_pngs, diff_pngs,
+                             [baseline_cache] * n))
+
+
+def files_identical(a: Path, b: Path) -> bool:
+    """True if two files have the same bytes (size check first, then chunked compare)."""
+    return filecmp.cmp(a, b, shallow=False)
+
+
+def load_rgb(png: Path) -> np.ndarray:
+    """Decode an image file into an (h, w, 3) uint8 array."""
+    img = Image.open(png)
+    # pdftoppm already writes 8-bit RGB; convert() would only copy it
+    return np.asarray(img if img.mode == "RGB" else img.convert("RGB"))
+
+
+def load_rgb_cached(png: Path, cache_dir: Path) -> np.ndarray:
+    """load_rgb through a cache of decoded .npy files in *cache_dir*.
+
+    Baselines are compared on every run but rarely change, so the decoded
+    array is saved once and later loaded as a read-only memory map instead
+    of decompressing the PNG again. Entries are keyed by name, size and
+    mtime, so a re-saved baseline is decoded afresh.
+    """
+    png = Path(png)
+    cache_dir = Path(cache_dir)
+    st = png.stat()
+    npy = cache_dir / f"{png.name}.{st.st_size}.{st.st_mtime_ns}.npy"
+    try:
+        return np.load(npy, mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        pass
+    arr = load_rgb(png)
+    for stale in cache_dir.glob(f"{glob.escape(png.name)}.*.npy"):
+        stale.unlink(missing_ok=True)
+    # Write then rename, so parallel runs never load a half-written file;
+    # the temp name is unique per process and thread
+    tmp = npy.with_name(f"{npy.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, npy)
+    return arr
+
+
+def compare_arrays(baseline_arr: np.ndarray, current_arr: np.ndarray,
+                   want_diff: bool = True) -> tuple:
+    """compare_images on decoded (h, w, 3) uint8 arrays, without any file I/O.
+
+    Returns (diff_count, pixel_count, structural_count, diff), where diff is
+    the composite diff image as an array, or None if no pixel differs or
+    *want_diff* is False.
+    """
+    # Ensure same size (pad the smaller image with white). Pages of a
+    # regression run almost always match, so only mismatches allocate.
+    h, w = baseline_arr.shape[:2]
+    if current_arr.shape[:2] != (h, w):
+        h = max(h, current_arr.shape[0])
+        w = max(w, current_arr.shape[1])
+
+        def pad(arr):
+            if arr.shape[:2] == (h, w):
+                return arr
+            return np.pad(arr, ((0, h - arr.shape[0]), (0, w - arr.shape[1]), (0, 0)),
+                          constant_values=255)
+
+        baseline_arr = pad(baseline_arr)
+        current_arr = pad(current_arr)
 
     # Pixels that differ in any channel
-    diff_mask = np.any(baseline_arr != current_arr, axis=2)
-    diff_count = int(np.sum(diff_mask))
+    # (OR-ing the three channel planes is several times faster than
+    # np.any(..., axis=2), which reduces along the short innermost axis)
+    ne = baseline_arr != current_arr
+    diff_mask = ne[..., 0] | ne[..., 1] | ne[..., 2]
+    diff_count = int(np.count_nonzero(diff_mask))
+    if diff_count == 0:
+        # Equal pixels cannot flip ink presence; skip the gray sums entirely
+        return 0, w * h, 0, None
 
     # Structural difference: ink presence (binarized at mid-gray) flips in
     # CLUSTERS. Cross-platform anti-aliasing may land individual edge pixels
@@ -117,8 +349,12 @@ def compare_images(baseline_png: Path, current_png: Path, diff_png: Path) -> tup
     # scatter; any real layout/glyph change (even a 1 px shift) flips a
     # connected run of pixels along the stroke edge. A flip only counts as
     # structural if at least one 8-neighbor also flips.
-    b_ink = np.mean(baseline_arr, axis=2) < 128
-    c_ink = np.mean(current_arr, axis=2) < 128
+    # Channel sums in uint16 (max 765) stand in for the float mean:
+    # mean < 128  <=>  sum < 384, and floor(mean) == sum // 3.
+    b_sum = baseline_arr.sum(axis=2, dtype=np.uint16)
+    c_sum = current_arr.sum(axis=2, dtype=np.uint16)
+    b_ink = b_sum < 384
+    c_ink = c_sum < 384
     flips = b_ink != c_ink
     if flips.any():
         padded = np.pad(flips, 1, mode="constant")
@@ -129,26 +365,30 @@ def compare_images(baseline_png: Path, current_png: Path, diff_png: Path) -> tup
                     continue
                 neighbor_any |= padded[1 + dy:padded.shape[0] - 1 + dy,
                                        1 + dx:padded.shape[1] - 1 + dx]
-        structural_count = int(np.sum(flips & neighbor_any))
+        structural_count = int(np.count_nonzero(flips & neighbor_any))
     else:
         structural_count = 0
 
-    if diff_count > 0:
-        b_gray = np.mean(baseline_arr, axis=2)
-        c_gray = np.mean(current_arr, axis=2)
-
+    if diff_count > 0 and want_diff:
         # Start with a grayscale version of the baseline
-        result = np.stack([b_gray, b_gray, b_gray], axis=2).astype(np.uint8)
-
-        # Colour differing pixels: blue (baseline) + red (current)
-        bs = (255 - b_gray[diff_mask]).astype(np.float32)
-        cs = (255 - c_gray[diff_mask]).astype(np.float32)
+        b_gray = (b_sum // 3).astype(np.uint8)
+        result = np.repeat(b_gray[..., None], 3, axis=2)
 
-        result[diff_mask, 0] = np.clip(255 - bs, 0, 255).astype(np.uint8)
-        result[diff_mask, 1] = np.clip(255 - bs - cs, 0, 255).astype(np.uint8)
-        result[diff_mask, 2] = np.clip(255 - cs, 0, 255).astype(np.uint8)
+        # Colour differing pixels: blue (baseline) + red (current).
+        # Red keeps the baseline gray and blue takes the current gray;
+        # green is b_gray + c_gray - 255 clipped at 0, all in integers.
+        # Work in place on the masked uint16 values: no float or full-page temporaries.
+        c_diff = c_sum[diff_mask]
+        green = b_sum[diff_mask]
+        green += c_diff
+        green //= 3
+        np.maximum(green, 255, out=green)
+        green -= 255
+        c_diff //= 3
+        result[diff_mask, 1] = green
+        result[diff_mask, 2] = c_diff
 
-        diff_img = Image.fromarray(result)
-        diff_img.save(str(diff_png))
+    else:
+        result = None
 
-    return diff_count, w * h, structural_count
+    return diff_count, w * h, structural_count, result
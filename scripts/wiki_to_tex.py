@@ -15,29 +15,38 @@ import re
 import sys
 import argparse
 
+_FOOTNOTE_RE = re.compile(r'\[\d+\]')
+# [文字] 与 【文字】 合成一个模式，一遍扫描；按 lastgroup 分派
+_NOTE_RE = re.compile(r'\[(?P<side>[^\]]*)\]|【(?P<anno>[^】]*)】')
+_PUNCT_TABLE = str.maketrans('', '', '，。！？：、「」『』（）《》.')
+_LEADING_WS_RE = re.compile(r'^[ \t\u3000]+', flags=re.MULTILINE)
+
+
+def _note_repl(m):
+    # 括号内可能嵌套另一种括号，对内容递归处理
+    if m.lastgroup == 'side':
+        return '\\侧批{' + _NOTE_RE.sub(_note_repl, m.group('side')) + '}'
+    return '\\批注{' + _NOTE_RE.sub(_note_repl, m.group('anno')) + '}'
+
 def convert_wiki_to_tex(text):
     # 1. [数字] 是脚注，全部删掉
     # Remove footnotes first: [1], [12], etc.
-    text = re.sub(r'\[\d+\]', '', text)
+    text = _FOOTNOTE_RE.sub('', text)
     
     # 2. [文字] 转为 \侧批{文字} 
-    # Convert remaining brackets [text] to \侧批{text}
-    # Use non-greedy match .*? to handle multiple occurrences on one line
-    text = re.sub(r'\[([^\]]*)\]', r'\\侧批{\1}', text)
-    
     # 3. 【文字】 转为 \批注{文字}
-    # Convert lenticular brackets 【text】 to \批注{text}
-    text = re.sub(r'【([^】]*)】', r'\\批注{\1}', text)
+    # Convert remaining brackets [text] to \侧批{text} and 【text】 to \批注{text}
+    # in a single pass over the text
+    text = _NOTE_RE.sub(_note_repl, text)
     
     # 4. 移除所有标点符号 ，。！？、「」『』（）《》.
     # Note: Added \. to capture the period. Added full-width parenthesis （） if implied by context, 
     # though prompt only listed specific ones. Prompt list: ，。！？、「」『』（）《》.
-    punctuation_pattern = r'[，。！？：、「」『』（）《》\.]'
-    text = re.sub(punctuation_pattern, '', text)
+    text = text.translate(_PUNCT_TABLE)
     
     # 5. Remove leading whitespace (including full-width spaces) from each line
     # 移除每段段首的空格（包括全角空格）
-    text = re.sub(r'^[ \t\u3000]+', '', text, flags=re.MULTILINE)
+    text = _LEADING_WS_RE.sub('', text)
 
     # 6. Replace □ with \空格
     # 替换 □ 为 \空格
@@ -53,16 +62,20 @@ def main():
     args = parser.parse_args()
     
     # Read input
+    # 一次读入全部字节再整体解码，比文本模式逐块增量解码快
     if args.input_file:
         try:
-            with open(args.input_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+            with open(args.input_file, 'rb') as f:
+                content = f.read().decode('utf-8')
         except Exception as e:
             sys.stderr.write(f"Error reading input file: {e}\n")
             sys.exit(1)
     else:
         # Read from stdin
-        content = sys.stdin.read()
+        content = sys.stdin.buffer.read().decode('utf-8')
+    # 与文本模式读入一致（文件和 stdin 都是）：统一换行符
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
         
     # Process content
     converted_content = convert_wiki_to_tex(content)
@@ -15,6 +15,7 @@ GitHub Step Summary 不渲染本地文件/base64 图片，所以对比图放 art
 summary 里给出文字定位 + 指引。
 """
 
+import glob
 import json
 import os
 import re
@@ -127,6 +128,21 @@ def make_composite(baseline, current, regions, out_path):
     comp.save(out_path)
 
 
+def find_diff_pages(diff_dir, stem):
+    """[(页码, 路径)]：diff_<stem>-<页>.png，按页码排序。
+
+    页码直接从文件名切出；只认 stem 后紧跟数字的文件，
+    diff_guji-*.png 不会误匹配 diff_guji-digital-basic-1.png。"""
+    prefix = "diff_%s-" % stem
+    pages = []
+    for p in diff_dir.glob(glob.escape(prefix) + "*.png"):
+        num = p.name[len(prefix):-len(".png")]
+        if num.isascii() and num.isdigit():
+            pages.append((int(num), p))
+    pages.sort()
+    return pages
+
+
 def summarize_suite(suite, lines):
     diff_dir = TEST_DIR / suite / "diff"
     baseline_dir = TEST_DIR / suite / "baseline"
@@ -153,9 +169,7 @@ def summarize_suite(suite, lines):
         if r["passed"]:
             continue
         stem = re.sub(r"\.tex$", "", r["name"])
-        diff_pages = sorted(
-            diff_dir.glob("diff_%s-*.png" % stem),
-            key=lambda p: int(re.search(r"-(\d+)\.png$", p.name).group(1)))
+        diff_pages = find_diff_pages(diff_dir, stem)
         if not diff_pages:
             lines.append("")
             lines.append("### ❌ %s" % r["name"])
@@ -167,8 +181,7 @@ def summarize_suite(suite, lines):
         lines.append("")
         lines.append("| 页 | 差异区域（九宫格视觉方位） |")
         lines.append("|---|---|")
-        for diff_png in diff_pages:
-            page = re.search(r"-(\d+)\.png$", diff_png.name).group(1)
+        for page, diff_png in diff_pages:
             page_name = diff_png.name[len("diff_"):]
             b_path = baseline_dir / page_name
             c_path = current_dir / page_name
@@ -4,17 +4,23 @@ import subprocess
 import shutil
 import sys
 import argparse
-import re
+import glob
+import hashlib
 import json
+import re
 from pathlib import Path
 
 # image_compare lives in scripts/
 _BASE_DIR = Path(__file__).parent.parent.resolve()
 sys.path.insert(0, str(_BASE_DIR / "scripts"))
-from image_compare import pdf_to_pngs, compare_images
+from image_compare import compare_page_batch, find_pages, load_rgb_cached, pdf_to_pngs
 
 import concurrent.futures
-import multiprocessing
+
+# lualatex 以较低优先级运行，不拖慢交互使用。只作用于子进程：
+# 在线程池 worker 线程上调 os.nice/sched_setaffinity 会被该线程之后创建的
+# 所有线程（包括页面比较线程池）继承
+NICE_PREFIX = ["nice", "-n", "5"] if shutil.which("nice") else []
 
 # Paths relative to the project root
 BASE_DIR = Path(__file__).parent.parent.resolve()
@@ -72,46 +78,92 @@ def strip_volatile_json(data):
     return data
 
 
-def run_command(cmd, cwd=None, capture=True, log_list=None):
+def run_command(cmd, cwd=None, capture=True, log_list=None, log_path=None):
+    """运行命令。给出 log_path 时 stdout/stderr 合并直接写入该文件，
+    不经 Python 管道缓存（整本书的 lualatex 输出很长）。"""
     msg = f"Running: {' '.join(cmd)}"
     if log_list is not None:
         log_list.append(msg)
     else:
         print(msg)
 
-    if capture:
+    if log_path is not None:
+        with open(log_path, "wb") as out:
+            result = subprocess.run(cmd, cwd=cwd, stdout=out, stderr=subprocess.STDOUT)
+    elif capture:
         result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
     else:
         result = subprocess.run(cmd, cwd=cwd)
     return result
 
-def compile_tex(tex_file, pdf_dir, log_list):
-    """Compile TeX file to PDF in the given pdf_dir."""
+def read_tail(path, max_bytes=1 << 16):
+    """文件末尾至多 max_bytes 字节，按 UTF-8 解码（截断处的残字替换掉）"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - max_bytes))
+        return f.read().decode("utf-8", errors="replace")
+
+
+# 两遍编译之间传递信息的辅助文件；内容稳定时第二遍不会改变排版
+RERUN_EXTS = (".aux", ".toc", ".out")
+
+
+def read_rerun_files(pdf_dir, stem):
+    """{扩展名: 内容}，只含存在的辅助文件"""
+    found = {}
+    for ext in RERUN_EXTS:
+        try:
+            found[ext] = (pdf_dir / f"{stem}{ext}").read_bytes()
+        except FileNotFoundError:
+            pass
+    return found
+
+
+def compile_tex(tex_file, pdf_dir, log_list, aux_cache=None):
+    """Compile TeX file to PDF in the given pdf_dir.
+
+    给出 aux_cache 目录（--fast）时，先放回上次运行留下的 .aux 等文件；
+    若第一遍写出的辅助文件与读入的完全相同且日志没有要求重跑，排版已稳定，
+    省去第二遍。pdf_dir 每个套件结束都会清空，所以辅助文件要另存。"""
     ex_name = tex_file.name
-    pdf_name = tex_file.stem + ".pdf"
+    stem = tex_file.stem
+    pdf_name = stem + ".pdf"
+    console_log = pdf_dir / f"{stem}.console"
+
+    previous = None
+    if aux_cache is not None:
+        previous = read_rerun_files(aux_cache, stem)
+        for ext, data in previous.items():
+            (pdf_dir / f"{stem}{ext}").write_bytes(data)
 
     # We run lualatex twice to ensure correct layout (typical for guji)
     for i in range(2):
+        if i == 1 and previous:
+            if read_rerun_files(pdf_dir, stem) == previous and \
+                    "Rerun to get" not in read_tail(console_log):
+                log_list.append(f"Auxiliary files unchanged, skipping pass 2 for {ex_name}")
+                break
         log_list.append(f"Compilation pass {i+1} for {ex_name}...")
         res = run_command([
+            *NICE_PREFIX,
             "lualatex",
             "-interaction=nonstopmode",
             f"-output-directory={pdf_dir}",
             str(tex_file.name)
-        ], cwd=tex_file.parent, log_list=log_list)
+        ], cwd=tex_file.parent, log_list=log_list, log_path=console_log)
 
         if res.returncode != 0:
             log_list.append(f"ERROR: Compilation failed for {ex_name}")
             # 输出 lualatex 日志尾部，方便在 CI 上直接定位错误
-            output = res.stdout or ""
-            if res.stderr:
-                output += "\n" + res.stderr
-            tail = output.strip().splitlines()[-40:]
+            tail = read_tail(console_log).strip().splitlines()[-40:]
             log_list.append(f"--- lualatex output tail for {ex_name} ---")
             log_list.extend(tail)
             log_list.append("--- end of output ---")
             return False
 
+    if aux_cache is not None:
+        for ext, data in read_rerun_files(pdf_dir, stem).items():
+            (aux_cache / f"{stem}{ext}").write_bytes(data)
     return pdf_dir / pdf_name
 
 def pdf_to_pngs_logged(pdf_file, output_dir, log_list):
@@ -122,16 +174,136 @@ def pdf_to_pngs_logged(pdf_file, output_dir, log_list):
     return pngs
 
 
-def compare_images_logged(baseline_png, current_png, diff_png, log_list):
-    """Wrapper around image_compare.compare_images (log_list kept for API compat)."""
-    return compare_images(baseline_png, current_png, diff_png)
+# 参与渲染和比较、但不在 tex/ 下的文件：比较代码本身也算输入
+HARNESS_FILES = (Path(__file__).resolve(), _BASE_DIR / "scripts" / "image_compare.py")
+
+
+def tool_version(cmd):
+    """工具版本输出（lualatex --version 等）；工具不可用时返回空串"""
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError:
+        return ""
+    return res.stdout + res.stderr
+
+
+def package_fingerprint():
+    """所有文件共用的输入摘要，每次运行只算一次：
+    luatex-cn 源码（tex/，texmf 以符号链接指向它）、测试字体、
+    lualatex/pdftoppm 版本和比较代码本身。"""
+    h = hashlib.blake2b(digest_size=16)
+    for src_dir in (BASE_DIR / "tex", FONTS_DIR):
+        for p in sorted(src_dir.rglob("*")):
+            if p.is_file():
+                h.update(p.relative_to(BASE_DIR).as_posix().encode("utf-8") + b"\0")
+                h.update(p.read_bytes())
+    for f in HARNESS_FILES:
+        h.update(f.read_bytes())
+    for cmd in (["lualatex", "--version"], ["pdftoppm", "-v"]):
+        h.update(tool_version(cmd).encode("utf-8"))
+    return h.hexdigest()
+
+
+# 源码中显式引用的文件：\input/\include 的 .tex，\includegraphics 等的图片
+_INPUT_REF_RE = re.compile(
+    r"\\(?:input|include|InputIfFileExists|includegraphics)\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}")
+_INPUT_EXTS = ("", ".tex", ".png", ".jpg", ".jpeg", ".pdf")
+
+
+def referenced_files(tex_file, text):
+    """text 中 \\input/\\includegraphics 等引用的文件（含 ../ 路径）。
+    lualatex 在 tex_file 所在目录运行，路径都相对该目录解析；被引用的 .tex 也递归展开"""
+    base = tex_file.parent
+    found = {}
+    pending = [text]
+    while pending:
+        for m in _INPUT_REF_RE.finditer(pending.pop()):
+            name = m.group(1).strip()
+            for ext in _INPUT_EXTS:
+                path = (base / (name + ext)).resolve()
+                if path.is_file():
+                    if path not in found and path != tex_file.resolve():
+                        found[path] = path.read_bytes()
+                        if path.suffix == ".tex":
+                            pending.append(found[path].decode("utf-8", errors="ignore"))
+                    break
+    return found
+
+
+def input_fingerprint(tex_file, package_hash):
+    """TeX 源文件 + 它引用的文件 + 所有文件共用部分（package_fingerprint）的摘要。
+
+    引用的文件包括 \\input/\\includegraphics 显式给出的路径（含 ../ 相对路径），
+    以及文件名或去扩展名后的名字出现在源码中的同目录文件（印章图片、.cfg 等），宁多勿漏。"""
+    source = tex_file.read_bytes()
+    text = source.decode("utf-8", errors="ignore")
+    h = hashlib.blake2b(source, digest_size=16)
+    h.update(package_hash.encode("ascii"))
+    for path, data in sorted(referenced_files(tex_file, text).items()):
+        h.update(str(path).encode("utf-8") + b"\0")
+        h.update(data)
+    with os.scandir(tex_file.parent) as it:
+        siblings = sorted(e.name for e in it if e.is_file() and e.name != tex_file.name)
+    for name in siblings:
+        if name in text or name.rsplit(".", 1)[0] in text:
+            h.update(name.encode("utf-8") + b"\0")
+            h.update((tex_file.parent / name).read_bytes())
+    return h.hexdigest()
+
+
+def baseline_signature(baseline_dir, stem):
+    """基线 PNG/JSON 的文件名、大小和 mtime；基线被更新或重新检出后缓存即失效"""
+    files = find_pages(baseline_dir, stem)
+    files.append(baseline_dir / f"{stem}-layout.json")
+    h = hashlib.blake2b(digest_size=16)
+    for f in files:
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        h.update(f"{f.name}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
 
+def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir,
+                 baseline_cache=None, render_cache=None, package_hash=None, aux_cache=None):
+    """编译、渲染并与基线比较，返回 (success, info, log_list)。
 
-def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
+    给出 render_cache 目录时，上次成功运行的输入摘要记在 {stem}.hash 中；
+    源文件、引用文件、包源码和基线都未变化就跳过 lualatex 和 pdftoppm。"""
+    if render_cache is None:
+        success, info, log_list = _process_file(tex_file, mode, pdf_dir, baseline_dir,
+                                                current_dir, diff_dir, baseline_cache, aux_cache)
+    else:
+        stamp = render_cache / f"{tex_file.stem}.hash"
+        input_hash = input_fingerprint(tex_file, package_hash)
+        try:
+            cached = stamp.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            cached = None
+        if cached == f"{input_hash} {baseline_signature(baseline_dir, tex_file.stem)}":
+            success, info = True, "unchanged (cache hit)"
+            log_list = [f"\nProcessing {tex_file.name}... unchanged (cache hit)"]
+        else:
+            success, info, log_list = _process_file(tex_file, mode, pdf_dir, baseline_dir,
+                                                    current_dir, diff_dir, baseline_cache,
+                                                    aux_cache)
+            if success:
+                # save 可能刚改写了基线，签名要在处理之后重新取
+                stamp.write_text(
+                    f"{input_hash} {baseline_signature(baseline_dir, tex_file.stem)}\n",
+                    encoding="utf-8")
+            else:
+                stamp.unlink(missing_ok=True)
+    return success, info, log_list
+
+
+def _process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir,
+                  baseline_cache=None, aux_cache=None):
     log_list = [f"\nProcessing {tex_file.name}..."]
 
     # 1. Compile
-    pdf_file = compile_tex(tex_file, pdf_dir, log_list)
+    pdf_file = compile_tex(tex_file, pdf_dir, log_list, aux_cache)
     if not pdf_file or not pdf_file.exists():
         return False, "Compilation failed", log_list
 
@@ -153,23 +325,13 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
             return False, "PNG conversion failed", log_list
 
         # 3. Check if baselines already exist and compare
-        existing_baselines = sorted(
-            [f for f in baseline_dir.glob(f"{pdf_file.stem}-*.png")
-             if re.match(rf"^{re.escape(pdf_file.stem)}-\d+\.png$", f.name)],
-            key=lambda x: int(re.search(r'-(\d+)\.png$', x.name).group(1)))
+        existing_baselines = find_pages(baseline_dir, pdf_file.stem)
 
         images_match = False
         if len(existing_baselines) == len(new_pngs):
-            all_match = True
-            for b_png, n_png in zip(existing_baselines, new_pngs):
-                diff_png = diff_dir / f"temp_diff_{n_png.name}"
-                diff_count, _, _ = compare_images_logged(b_png, n_png, diff_png, log_list)
-                if diff_png.exists():
-                    diff_png.unlink()
-                if diff_count != 0:
-                    all_match = False
-                    break
-            images_match = all_match
+            # 只需要差异像素数，不生成差异图
+            page_results = compare_page_batch(existing_baselines, new_pngs, None, baseline_cache)
+            images_match = all(diff_count == 0 for diff_count, _, _ in page_results)
 
         # Save JSON baseline if present
         json_saved = False
@@ -197,22 +359,29 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
                 log_list.append(f"JSON baseline saved for {tex_file.name}")
                 json_saved = True
 
+        # 两个分支都要清掉上次 check 留下的差异图
+        for diff_png in diff_dir.glob(f"diff_{pdf_file.stem}-*.png"):
+            diff_png.unlink()
+
         if images_match and not json_saved:
             log_list.append(f"No visual changes - deleting PDF for {tex_file.name}")
             for png in new_pngs:
                 png.unlink()
-            for diff_png in diff_dir.glob(f"diff_{pdf_file.stem}-*.png"):
-                diff_png.unlink()
-            if pdf_file.exists():
-                pdf_file.unlink()
+            pdf_file.unlink(missing_ok=True)
             return True, f"No changes ({len(existing_baselines)} pages)", log_list
         else:
+            # current/ 与 baseline/ 在同一文件系统，os.replace 即一次 rename，
+            # 同名旧基线被原子覆盖；只需删掉新渲染中已不存在的页
+            new_names = {png.name for png in new_pngs}
             for old_png in existing_baselines:
-                old_png.unlink()
+                if old_png.name not in new_names:
+                    old_png.unlink()
             for png in new_pngs:
-                shutil.move(str(png), str(baseline_dir / png.name))
-            for diff_png in diff_dir.glob(f"diff_{pdf_file.stem}-*.png"):
-                diff_png.unlink()
+                os.replace(png, baseline_dir / png.name)
+            # --npy-cache：顺手写好新基线的解码缓存，下次 check 直接内存映射读取
+            if baseline_cache is not None:
+                for png in new_pngs:
+                    load_rgb_cached(baseline_dir / png.name, baseline_cache)
             extra = " + JSON" if json_saved else ""
             log_list.append(f"Saved {len(new_pngs)} baseline pages{extra}.")
             return True, f"Saved {len(new_pngs)} pages{extra}", log_list
@@ -223,11 +392,8 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
         if not current_pngs:
             return False, "PNG conversion failed", log_list
 
-        # Use regex to match exact stem followed by -N.png (not stem-more-stuff-N.png)
-        baseline_pngs = sorted(
-            [f for f in baseline_dir.glob(f"{pdf_file.stem}-*.png")
-             if re.match(rf"^{re.escape(pdf_file.stem)}-\d+\.png$", f.name)],
-            key=lambda x: int(re.search(r'-(\d+)\.png$', x.name).group(1)))
+        # Exact stem followed by -N.png (not stem-more-stuff-N.png)
+        baseline_pngs = find_pages(baseline_dir, pdf_file.stem)
 
         if len(current_pngs) != len(baseline_pngs):
             return False, f"Page count mismatch: current={len(current_pngs)}, baseline={len(baseline_pngs)}", log_list
@@ -237,10 +403,12 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
         total_aa_pixels = 0   # gray-level-only diffs (no ink-presence flip)
         failing_pages = []
 
-        for i, (b_png, c_png) in enumerate(zip(baseline_pngs, current_pngs)):
-            diff_png = diff_dir / f"diff_{c_png.name}"
-            diff_count, pixel_count, structural_count = \
-                compare_images_logged(b_png, c_png, diff_png, log_list)
+        # 各页比较互不依赖，由 compare_page_batch 用线程并行
+        diff_pngs = [diff_dir / f"diff_{c_png.name}" for c_png in current_pngs]
+        page_results = compare_page_batch(baseline_pngs, current_pngs, diff_pngs, baseline_cache)
+
+        for i, (diff_png, (diff_count, pixel_count, structural_count)) in \
+                enumerate(zip(diff_pngs, page_results)):
 
             diff_ratio = 100 * diff_count / pixel_count
 
@@ -260,10 +428,9 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
                 log_list.append(
                     f"  Page {i+1}: {diff_count} ({diff_ratio:.4f}%) pixels differ in"
                     f" anti-aliasing only (no structural change) — IGNORABLE.")
-                if diff_png.exists():
-                    diff_png.unlink()
-            elif diff_png.exists():
-                diff_png.unlink()
+                diff_png.unlink(missing_ok=True)
+            else:
+                diff_png.unlink(missing_ok=True)
 
         total_diff_ratio = 100 * total_diff_pixels / total_pixels
 
@@ -298,8 +465,7 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
             log_list.append(f"SUCCESS: {tex_file.name} matches baseline (all {len(current_pngs)} pages).")
             for png in current_pngs:
                 png.unlink()
-            if pdf_file.exists():
-                pdf_file.unlink()
+            pdf_file.unlink(missing_ok=True)
             if total_aa_pixels > 0:
                 return True, f"{total_aa_pixels} px AA-only diff (ignorable)", log_list
             return True, 0, log_list
@@ -314,6 +480,7 @@ def process_file(tex_file, mode, pdf_dir, baseline_dir, current_dir, diff_dir):
 def resolve_files_in_suite(file_args, tex_dir):
     """Resolve file arguments to actual TeX file paths within a suite's tex_dir."""
     tex_files = []
+    by_name = None  # 文件名 → tex_dir 下所有同名文件，首次需要时遍历一次目录树
     for f in file_args:
         # 1. Try as direct path (absolute or relative to CWD)
         p = Path(f)
@@ -328,9 +495,19 @@ def resolve_files_in_suite(file_args, tex_dir):
             continue
 
         # 3. Search recursively in tex_dir
-        found = list(tex_dir.rglob(f))
-        if not found and not f.endswith(".tex"):
-            found = list(tex_dir.rglob(f + ".tex"))
+        if glob.has_magic(f) or "/" in f or os.sep in f:
+            # 通配符或带子目录的参数仍交给 rglob
+            found = list(tex_dir.rglob(f))
+            if not found and not f.endswith(".tex"):
+                found = list(tex_dir.rglob(f + ".tex"))
+        else:
+            if by_name is None:
+                by_name = {}
+                for p in tex_dir.rglob("*"):
+                    by_name.setdefault(p.name, []).append(p)
+            found = by_name.get(f, [])
+            if not found and not f.endswith(".tex"):
+                found = by_name.get(f + ".tex", [])
 
         if found:
             tex_files.extend(found)
@@ -365,8 +542,9 @@ def split_files_by_suite(file_args, suites_to_run):
     return groups
 
 
-def run_suite(suite_name, suite_dir, mode, file_args, jobs):
-    """Run regression tests for a single suite. Returns True if all passed."""
+def run_suite(suite_name, suite_dir, mode, file_args, executor, npy_cache=False,
+              package_hash=None, fast=False):
+    """Run regression tests for a single suite on *executor*. Returns True if all passed."""
     tex_dir, pdf_dir, baseline_dir, current_dir, diff_dir = get_suite_dirs(suite_dir)
 
     # Skip if tex_dir doesn't exist or is empty
@@ -378,6 +556,24 @@ def run_suite(suite_name, suite_dir, mode, file_args, jobs):
     for d in [pdf_dir, baseline_dir, current_dir, diff_dir]:
         d.mkdir(parents=True, exist_ok=True)
 
+    # 解码后的基线缓存（.npy，按内存映射读取），放在 current/ 下，不进版本库
+    baseline_cache = None
+    if npy_cache:
+        baseline_cache = current_dir / "baseline_npy"
+        baseline_cache.mkdir(exist_ok=True)
+
+    # 输入未变的文件跳过编译和渲染（--cache 开启）
+    render_cache = None
+    if package_hash is not None:
+        render_cache = current_dir / "render_cache"
+        render_cache.mkdir(exist_ok=True)
+
+    # --fast：保留上次的 .aux 等文件，排版稳定时只编译一遍
+    aux_cache = None
+    if fast:
+        aux_cache = current_dir / "aux_cache"
+        aux_cache.mkdir(exist_ok=True)
+
     # Find TeX files
     if file_args:
         tex_files = resolve_files_in_suite(file_args, tex_dir)
@@ -391,23 +587,23 @@ def run_suite(suite_name, suite_dir, mode, file_args, jobs):
     results = []
     all_passed = True
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
-        future_to_file = {
-            executor.submit(process_file, f, mode, pdf_dir, baseline_dir, current_dir, diff_dir): f
-            for f in tex_files
-        }
-        for future in concurrent.futures.as_completed(future_to_file):
-            tex_file = future_to_file[future]
-            try:
-                success, info, log = future.result()
-                print("\n".join(log))
-                results.append((tex_file.name, success, info))
-                if not success:
-                    all_passed = False
-            except Exception as exc:
-                print(f"{tex_file.name} generated an exception: {exc}")
-                results.append((tex_file.name, False, f"Exception: {exc}"))
+    future_to_file = {
+        executor.submit(process_file, f, mode, pdf_dir, baseline_dir, current_dir, diff_dir,
+                        baseline_cache, render_cache, package_hash, aux_cache): f
+        for f in tex_files
+    }
+    for future in concurrent.futures.as_completed(future_to_file):
+        tex_file = future_to_file[future]
+        try:
+            success, info, log = future.result()
+            print("\n".join(log))
+            results.append((tex_file.name, success, info))
+            if not success:
                 all_passed = False
+        except Exception as exc:
+            print(f"{tex_file.name} generated an exception: {exc}")
+            results.append((tex_file.name, False, f"Exception: {exc}"))
+            all_passed = False
 
     # Print summary for this suite
     print(f"\n{'='*40}")
@@ -443,6 +639,19 @@ def main():
     parser.add_argument("files", nargs="*", help="Specific TeX files to process (optional)")
     parser.add_argument("-j", "--jobs", type=int, default=8,
                         help="Number of parallel jobs (default: 8)")
+    parser.add_argument("--npy-cache", action="store_true",
+                        help="Cache decoded baselines as .npy under current/ and "
+                             "memory-map them on later runs (~25 MB per 300-DPI page)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Skip files whose TeX source, referenced files, the package "
+                             "sources, test fonts, lualatex/pdftoppm versions, the comparison "
+                             "code and the baseline are all unchanged since the last "
+                             "successful run. Skipped files are reported as passed without "
+                             "being compiled, so leave this off when checking for regressions "
+                             "from anything outside those inputs")
+    parser.add_argument("--fast", action="store_true",
+                        help="Keep each file's .aux/.toc/.out between runs and skip the "
+                             "second lualatex pass when the first one leaves them unchanged")
 
     # Suite selection flags
     parser.add_argument("--past-issues", action="store_true",
@@ -479,12 +688,20 @@ def main():
 
     print(f"Suites: {', '.join(name for name, _ in run_plan)}\n")
 
-    for suite_name, files in run_plan:
-        suite_dir = SUITES[suite_name]
-        print(f"--- Suite: {suite_name} ---")
-        passed = run_suite(suite_name, suite_dir, args.command, files, args.jobs)
-        if not passed:
-            all_passed = False
+    package_hash = package_fingerprint() if args.cache else None
+
+    # 所有套件共用一个线程池。耗时都在 lualatex/pdftoppm 子进程和释放 GIL 的
+    # PNG 解码、NumPy 比较里，用线程免去进程启动开销；日志列表也无需再经
+    # pickle 传回，直接返回即可
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.jobs) as executor:
+        for suite_name, files in run_plan:
+            suite_dir = SUITES[suite_name]
+            print(f"--- Suite: {suite_name} ---")
+            passed = run_suite(suite_name, suite_dir, args.command, files, executor,
+                               args.npy_cache, package_hash, args.fast)
+            if not passed:
+                all_passed = False
 
     if not all_passed:
         sys.exit(1)
@@ -1,54 +1,104 @@
+import bisect
+import itertools
 import re
 import os
 
+# Patterns used by clean_latex (called once per line/block), compiled once
+_BEGIN_DUAN_RE = re.compile(r'\\begin\{段落\}(?:\[[^\]]*\])?')
+_STYLE_RE = re.compile(r'\\样式(?:\[[^\]]*\])?\{([^\}]*)\}')
+_JIAZHU_RE = re.compile(r'\\夹注(?:\[[^\]]*\])?\{([^\}]*)\}')
+_REL_TAITOU_RE = re.compile(r'\\相对抬头(?:\[[^\]]*\])?\{([^\}]*)\}')
+_INLINE_RE = re.compile(
+    r'\\國朝(?:\s|\\\\|\\[单平挪]抬)*|\\\\|\\[单平挪]抬|\\[臣節]|\\空格|\[[^\]]*\]|[{}]')
+_BRACE_RE = re.compile(r'[{}]')
+_ZHENGWEN_RE = re.compile(r'\\begin\{正文\}(.*?)\\end\{正文\}', re.DOTALL)
+# Lines process_tex skips, and lines opening a \注{...}/\按{...} block
+_SKIP_PREFIXES = ('\\chapter', '\\newpage', '\\印章', '\\条目')
+_BLOCK_PREFIXES = ('\\注{', '\\按{')
+_TITLE_RE = re.compile(r'《([^》]+)》([^ \n\d]+卷|[^ \n\d]+)')
+
+def _inline_repl(m):
+    token = m.group()
+    if token.startswith('\\國朝'):
+        return '國朝'
+    if token in ('\\臣', '\\節'):
+        return token[1:]
+    return ''
+
 def clean_latex(text):
-    # Remove environments like \begin{段落}[...] and \end{段落}
-    text = re.sub(r'\\begin\{段落\}(?:\[[^\]]*\])?', '', text)
-    text = text.replace(r'\end{段落}', '')
-    
-    # Remove \样式[...]{ } or \样式{ } wrapping, keeping only the content
-    # We use a non-greedy match for the content until the next '}'
-    # This assumes simple styles without nested braces of the same type
-    text = re.sub(r'\\样式(?:\[[^\]]*\])?\{([^\}]*)\}', r'\1', text)
-    
-    # Convert \夹注[...]{ } to ( )
-    text = re.sub(r'\\夹注(?:\[[^\]]*\])?\{([^\}]*)\}', r'（\1）', text)
-    
-    # Remove \相对抬头[...]{ } wrapping
-    text = re.sub(r'\\相对抬头(?:\[[^\]]*\])?\{([^\}]*)\}', r'\1', text)
-    
-    # Handle \\ (line breaks) and replace with space or nothing? 
-    # Usually in this context it's just a line break within a paragraph
-    text = text.replace(r'\\', '')
-    
-    # Handle specific commands
-    text = text.replace(r'\单抬', '')
-    text = text.replace(r'\平抬', '')
-    text = text.replace(r'\挪抬', '')
-    
-    # Handle \國朝: should result in "國朝" and remove the space after it
-    text = re.sub(r'\\國朝\s*', '國朝', text)
-    
-    text = text.replace(r'\臣', '臣')
-    text = text.replace(r'\節', '節')
-    text = text.replace(r'\空格', '')
-    text = re.sub(r'\[[^\]]*\]', '', text) # Remove leftover brackets
-    
-    # Remove any leftover braces that might have been part of unsupported commands
-    text = text.replace('{', '').replace('}', '')
-    
+    # Plain lines (titles, body text) carry no markup: nothing to remove
+    if '\\' not in text and '{' not in text and '}' not in text and '[' not in text:
+        return text.strip()
+
+    if '\\' in text:
+        # Remove environments like \begin{段落}[...] and \end{段落}
+        text = _BEGIN_DUAN_RE.sub('', text)
+        text = text.replace(r'\end{段落}', '')
+
+        # Remove \样式[...]{ } or \样式{ } wrapping, keeping only the content
+        # We use a non-greedy match for the content until the next '}'
+        # This assumes simple styles without nested braces of the same type
+        text = _STYLE_RE.sub(r'\1', text)
+
+        # Convert \夹注[...]{ } to ( )
+        text = _JIAZHU_RE.sub(r'（\1）', text)
+
+        # Remove \相对抬头[...]{ } wrapping
+        text = _REL_TAITOU_RE.sub(r'\1', text)
+
+    # Everything else is a plain token replacement, done in one pass:
+    # \\ (line breaks), \单抬/\平抬/\挪抬 and \空格 are dropped, \臣/\節 lose
+    # their backslash, leftover [...] options and braces of unsupported
+    # commands are removed, and \國朝 becomes "國朝" without the space after
+    # it (also across \\ or 抬头 commands that are themselves removed).
+    text = _INLINE_RE.sub(_inline_repl, text)
+
     # Clean up whitespace
     # Replace multiple spaces with one space, but preserve Chinese layout if possible
     # For this specific task, trimming is usually enough
     text = text.strip()
     return text
 
+def extract_braces_content(body, line_starts, start_index):
+    """Return the content of the first {...} group on line start_index of body,
+    and the index of the line holding its closing brace.
+
+    Line breaks inside the group are dropped and the first line loses its
+    trailing whitespace. An unclosed group runs to the end of body.
+    """
+    line_start = line_starts[start_index]
+    line_end = line_starts[start_index + 1] - 1
+    open_pos = body.find('{', line_start, line_end)
+    if open_pos < 0:
+        return "", start_index
+
+    # Simple brace counting; only visit the braces, not every character
+    depth = 1
+    close_pos = None
+    for m in _BRACE_RE.finditer(body, open_pos + 1):
+        if m.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                close_pos = m.start()
+                break
+
+    if close_pos is not None and close_pos < line_end:
+        return body[open_pos + 1:close_pos], start_index
+
+    first = body[open_pos + 1:line_end].rstrip()
+    if close_pos is None:
+        return first + body[line_end + 1:].replace('\n', ''), len(line_starts) - 1
+    end_idx = bisect.bisect_right(line_starts, close_pos) - 1
+    return first + body[line_end + 1:close_pos].replace('\n', ''), end_idx
+
 def process_tex(input_file, output_file):
     with open(input_file, 'r', encoding='utf-8') as f:
         content = f.read()
 
     # Extract content inside \begin{正文} ... \end{正文}
-    match = re.search(r'\\begin\{正文\}(.*?)\\end\{正文\}', content, re.DOTALL)
+    match = _ZHENGWEN_RE.search(content)
     if not match:
         print("Could not find \begin{正文} section.")
         return
@@ -60,48 +110,20 @@ def process_tex(input_file, output_file):
     
     results = []
     
-    def extract_braces_content(start_index):
-        line = lines[start_index].strip()
-        if '{' not in line:
-            return "", start_index
-        
-        start_pos = line.find('{') + 1
-        content_lines = []
-        
-        # Simple brace counting
-        depth = 1
-        current_idx = start_index
-        current_line = line[start_pos:]
-        
-        while depth > 0:
-            for i, char in enumerate(current_line):
-                if char == '{':
-                    depth += 1
-                elif char == '}':
-                    depth -= 1
-                    if depth == 0:
-                        content_lines.append(current_line[:i])
-                        return "".join(content_lines), current_idx
-            
-            content_lines.append(current_line)
-            current_idx += 1
-            if current_idx >= len(lines):
-                break
-            current_line = lines[current_idx]
-            
-        return "".join(content_lines), current_idx
+    # Offset of each line in body, so blocks can be sliced out directly
+    line_starts = [0, *itertools.accumulate(len(l) + 1 for l in lines)]
 
     i = 0
     while i < len(lines):
         line = lines[i].strip()
         
         # Skip empty lines or metadata
-        if not line or line.startswith('\\chapter') or line.startswith('\\newpage') or line.startswith('\\印章') or line.startswith('\\条目'):
+        if not line or line.startswith(_SKIP_PREFIXES):
             i += 1
             continue
             
         # Check for book title like 《...》...卷
-        title_match = re.search(r'《([^》]+)》([^ \n\d]+卷|[^ \n\d]+)', line)
+        title_match = _TITLE_RE.search(line)
         if title_match and not line.startswith('\\'):
             title = line.strip()
             results.append(f"==={title}===")
@@ -109,8 +131,8 @@ def process_tex(input_file, output_file):
             continue
             
         # Handle \注{...} and \按{...}
-        if line.startswith('\\注{') or line.startswith('\\按{'):
-            block_content, end_idx = extract_braces_content(i)
+        if line.startswith(_BLOCK_PREFIXES):
+            block_content, end_idx = extract_braces_content(body, line_starts, i)
             i = end_idx + 1
             
             cleaned = clean_latex(block_content)
@@ -13,6 +13,23 @@ import json
 import re
 from pathlib import Path
 
+# 需要平抬的御定/御纂书名
+IMPERIAL_BOOKS = [
+    '御定易经通注', '御纂周易折中', '御纂周易述义',
+    '御定周易述义', '御定易经', '御纂易经'
+]
+# 需要平抬的特殊词语，如"圣度"、"彝训"
+SPECIAL_TERMS = ['聖度', '彞訓']
+
+# 所有书名合成一个交替式，一遍扫描；书名前添加 \平抬，但不在行首
+_IMPERIAL_RE = re.compile(
+    r'(?<!^)(?<!\\平抬)《(' + '|'.join(map(re.escape, IMPERIAL_BOOKS)) + r')》')
+_SPECIAL_RE = re.compile(
+    r'(?<!^)(?<!\\平抬 )(' + '|'.join(map(re.escape, SPECIAL_TERMS)) + r')')
+# 未转义的 LaTeX 特殊字符
+_SPECIAL_CHAR_RE = re.compile(r'(?<!\\)([%$&#_])')
+_SENTENCE_END_RE = re.compile(r'[。！？]')
+
 
 def process_pingtai(text):
     """
@@ -21,23 +38,20 @@ def process_pingtai(text):
     """
     # 识别《书名》并在前面添加 \平抬
     # 例如：《御定易经通注》 -> \平抬《御定易经通注》
-    imperial_books = [
-        '御定易经通注', '御纂周易折中', '御纂周易述义',
-        '御定周易述义', '御定易经', '御纂易经'
-    ]
-
-    for book in imperial_books:
-        # 在书名前添加 \平抬，但不在行首
-        pattern = r'(?<!^)(?<!\\平抬)《' + re.escape(book) + r'》'
-        text = re.sub(pattern, r'\\平抬《' + book + r'》', text)
-
-    # 识别特殊词语，如"圣度"、"彝训"等需要平抬的词
-    special_terms = ['聖度', '彞訓']
-    for term in special_terms:
-        if term in text and not text.startswith(term):
-            # 在特殊词前添加 \平抬（如果不在行首）
-            pattern = r'(?<!^)(?<!\\平抬 )' + re.escape(term)
-            text = re.sub(pattern, r'\\平抬 ' + term, text, count=1)
+    text = _IMPERIAL_RE.sub(r'\\平抬《\1》', text)
+
+    # 特殊词语：以该词开头的文本整体跳过，否则只处理每个词第一次出现
+    pending = {term for term in SPECIAL_TERMS
+               if term in text and not text.startswith(term)}
+    if pending:
+        def _add_pingtai(m):
+            term = m.group(1)
+            if term not in pending:
+                return term
+            pending.discard(term)
+            return '\\平抬 ' + term
+
+        text = _SPECIAL_RE.sub(_add_pingtai, text)
 
     return text
 
@@ -47,22 +61,9 @@ def escape_latex_special_chars(text):
     转义 LaTeX 特殊字符
     但保留已经存在的命令（如 \平抬）
     """
-    # 不转义的字符列表（因为这些是中文内容，通常不需要转义）
-    # 主要转义 % $ & # _ { }
-    special_chars = {
-        '%': r'\%',
-        '$': r'\$',
-        '&': r'\&',
-        '#': r'\#',
-        '_': r'\_',
-    }
-
-    result = text
-    for char, escaped in special_chars.items():
-        if char in result and '\\' + char not in result:
-            result = result.replace(char, escaped)
-
-    return result
+    # 中文内容通常不需要转义，主要转义 % $ & # _
+    # 前面已有反斜杠的逐个视为已转义，一遍扫描完成
+    return _SPECIAL_CHAR_RE.sub(r'\\\1', text)
 
 
 def split_long_text(text, max_length=200):
@@ -73,24 +74,20 @@ def split_long_text(text, max_length=200):
     if len(text) <= max_length:
         return text
 
-    # 在句号、问号、感叹号后分割
-    sentences = re.split(r'([。！？])', text)
+    # 在句号、问号、感叹号后分割：只记边界位置，每行最后切一次片
+    bounds = [m.end() for m in _SENTENCE_END_RE.finditer(text)]
+    bounds.append(len(text))
 
     result = []
-    current_line = ""
-
-    for i in range(0, len(sentences), 2):
-        sentence = sentences[i]
-        punctuation = sentences[i + 1] if i + 1 < len(sentences) else ""
-
-        if len(current_line + sentence + punctuation) > max_length and current_line:
-            result.append(current_line)
-            current_line = sentence + punctuation
-        else:
-            current_line += sentence + punctuation
-
-    if current_line:
-        result.append(current_line)
+    start = end = 0  # 当前行为 text[start:end]
+    for bound in bounds:
+        if bound - start > max_length and end > start:
+            result.append(text[start:end])
+            start = end
+        end = bound
+
+    if end > start:
+        result.append(text[start:end])
 
     return '\\\\\n'.join(result) if len(result) > 1 else text
 
@@ -13,18 +13,13 @@ import re
 import json
 from pathlib import Path
 
+# <scanbreak> 等扫描标记、<entity> 及其他 XML 标签（只去标签，保留内容），以及空白
+_CLEAN_RE = re.compile(r'<[^>]+>|\s+')
+
 
 def clean_text(text):
     """清理文本，移除 XML 标签和特殊标记"""
-    # 移除 <scanbreak>, <scanbegin>, <scanend> 等扫描标记
-    text = re.sub(r'<scan[^>]*>', '', text)
-    # 移除 <entity> 标签，保留内容
-    text = re.sub(r'<entity[^>]*>([^<]*)</entity>', r'\1', text)
-    # 移除其他可能的 XML 标签
-    text = re.sub(r'<[^>]+>', '', text)
-    # 移除多余空白
-    text = re.sub(r'\s+', '', text)
-    return text.strip()
+    return _CLEAN_RE.sub('', text)
 
 
 def extract_title(line):
@@ -38,10 +33,9 @@ def extract_title(line):
     return None
 
 
-def is_comment_line(text):
-    """判断是否是评论行（以"謹案："或"謹按："开头）"""
-    cleaned = clean_text(text)
-    return cleaned.startswith('謹案：') or cleaned.startswith('謹按：')
+def is_comment_line(cleaned):
+    """判断是否是评论行（以"謹案："或"謹按："开头），参数为 clean_text 之后的文本"""
+    return cleaned.startswith(('謹案：', '謹按：'))
 
 
 def parse_column1_txt(input_file):
@@ -72,8 +66,8 @@ def parse_column1_txt(input_file):
         if line.startswith('***《'):
             # 保存前一本书
             if current_book:
-                current_book['detail'] = clean_text(''.join(detail_lines))
-                current_book['comment'] = clean_text(''.join(comment_lines))
+                current_book['detail'] = ''.join(detail_lines)
+                current_book['comment'] = ''.join(comment_lines)
                 books.append(current_book)
 
             # 开始新书
@@ -91,23 +85,25 @@ def parse_column1_txt(input_file):
 
         # 如果已经有当前书，处理内容
         elif current_book:
+            # 每行清理一次，既用于判断评论，也直接存入片段，成书时只需拼接
+            cleaned = clean_text(line)
             # 检查是否是评论
-            if is_comment_line(line):
+            if is_comment_line(cleaned):
                 in_comment = True
                 in_detail = False
-                comment_lines.append(line)
+                comment_lines.append(cleaned)
             # 如果已经在评论中，继续添加到评论
             elif in_comment:
-                comment_lines.append(line)
+                comment_lines.append(cleaned)
             # 否则是详细描述
             else:
                 in_detail = True
-                detail_lines.append(line)
+                detail_lines.append(cleaned)
 
     # 保存最后一本书
     if current_book:
-        current_book['detail'] = clean_text(''.join(detail_lines))
-        current_book['comment'] = clean_text(''.join(comment_lines))
+        current_book['detail'] = ''.join(detail_lines)
+        current_book['comment'] = ''.join(comment_lines)
         books.append(current_book)
 
     return books
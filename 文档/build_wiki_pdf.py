@@ -11,6 +11,8 @@ Usage:
   python3 文档/build_wiki_pdf.py
 """
 
+import concurrent.futures
+import functools
 import json
 import os
 import re
@@ -24,6 +26,7 @@ from pathlib import Path
 from markdown_it import MarkdownIt
 from PIL import Image
 from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
 from weasyprint.urls import URLFetcher, URLFetcherResponse
 
 # ---------------------------------------------------------------------------
@@ -39,6 +42,9 @@ WIKI_DIR = Path(
 )
 OUT_DIR = Path(__file__).resolve().parent  # 文档/
 
+# LUATEX_CN_WIKI_DEBUG=1 时在 PDF 旁保留中间 HTML，便于排查版式问题
+DEBUG = os.environ.get("LUATEX_CN_WIKI_DEBUG") == "1"
+
 # 单色（矢量轮廓）Noto Emoji：让 emoji 以字体子集嵌入 PDF。
 # 不加这个的话，Pango 回落到系统彩色 emoji 字体（macOS 的 Apple Color Emoji
 # 是 160px 位图），每个 emoji 都会变成一张 ~25 KB 的位图塞进 PDF。
@@ -293,9 +299,13 @@ EN_CHAPTERS = [
 # ---------------------------------------------------------------------------
 
 
+_SLUG_RE = re.compile(r"[^a-zA-Z0-9-]")
+
+
+@functools.lru_cache(maxsize=None)
 def slugify(name: str) -> str:
     """Create an anchor slug from a wiki page name."""
-    return re.sub(r"[^a-zA-Z0-9-]", "", name.lower().replace(" ", "-").replace(":", "-"))
+    return _SLUG_RE.sub("", name.lower().replace(" ", "-").replace(":", "-"))
 
 
 # TeX 家族词 → 经典 logo 样式。只处理正确大小写的整词
@@ -352,7 +362,12 @@ def strip_language_toggle(md: str) -> str:
     return md
 
 
-def convert_wiki_links(md: str, valid_slugs: set[str]) -> str:
+_WIKI_LINK_RE = re.compile(r"\[\[[^\]]+?\]\]")
+# [[display | target]] or [[target]]
+_WIKI_LINK_PARTS_RE = re.compile(r"\[\[([^|\]]+?)(?:\s*\|\s*([^\]]+?))?\]\]")
+
+
+def convert_wiki_links(md: str, valid_slugs: frozenset[str]) -> str:
     """Convert [[display | Page-Name]] wiki links to internal PDF anchors."""
     def _replace(m):
         display = m.group(1).strip()
@@ -365,11 +380,21 @@ def convert_wiki_links(md: str, valid_slugs: set[str]) -> str:
     # 表格单元格内的 wiki 链接会把竖线转义成 \|（[[A \| B]]），
     # 先还原为普通分隔符，否则反斜杠残留在链接文本里产生 \]，
     # 使 markdown 链接无法闭合、整段以字面文本渲染
-    md = re.sub(r"\[\[[^\]]+?\]\]", lambda m: m.group(0).replace("\\|", "|"), md)
+    if "\\|" in md:
+        md = _WIKI_LINK_RE.sub(lambda m: m.group(0).replace("\\|", "|"), md)
 
-    # [[display | target]] or [[target]]
-    md = re.sub(r"\[\[([^|\]]+?)(?:\s*\|\s*([^\]]+?))?\]\]", _replace, md)
-    return md
+    return _WIKI_LINK_PARTS_RE.sub(_replace, md)
+
+
+# 解析器规则初始化不便宜，只建一次，各章共用
+_MD = MarkdownIt("commonmark", {"html": True}).enable("table").enable("strikethrough")
+
+
+def render_chapter(raw_md: str, valid_slugs: frozenset[str]) -> str:
+    """Clean up one chapter's markdown and render it to HTML."""
+    raw_md = strip_language_toggle(raw_md)
+    raw_md = convert_wiki_links(raw_md, valid_slugs)
+    return texify_logos(_MD.render(raw_md))
 
 
 # ---------------------------------------------------------------------------
@@ -638,12 +663,16 @@ def build_cover_html(is_zh: bool) -> str:
 """
 
 
-def build_pdf(chapters: list[tuple[str, str]], css: str, out_path: Path, is_zh: bool):
-    """Build a single consolidated PDF from a list of wiki chapters."""
-    md_parser = MarkdownIt("commonmark", {"html": True}).enable("table").enable("strikethrough")
+def build_pdf(chapters: list[tuple[str, str]], css: str, out_path: Path, is_zh: bool,
+              font_config: FontConfiguration | None = None):
+    """Build a single consolidated PDF from a list of wiki chapters.
 
+    Pass the same font_config to several builds to share WeasyPrint's
+    font lookups between them.
+    """
     # Collect valid slugs for cross-referencing
-    valid_slugs = {slugify(name) for name, _ in chapters}
+    slugs = {name: slugify(name) for name, _ in chapters}
+    valid_slugs = frozenset(slugs.values())
 
     # Build HTML body（封面/目录也做 TeX logo 样式化）
     html_parts = [
@@ -651,19 +680,16 @@ def build_pdf(chapters: list[tuple[str, str]], css: str, out_path: Path, is_zh:
         texify_logos(build_toc_html(chapters, is_zh)),
     ]
 
-    for i, (name, _display) in enumerate(chapters):
-        slug = slugify(name)
-        raw_md = read_wiki_page(name)
-        if not raw_md:
-            continue
-
-        # Clean up
-        raw_md = strip_language_toggle(raw_md)
-        raw_md = convert_wiki_links(raw_md, valid_slugs)
-
-        # Render markdown to HTML
-        body_html = texify_logos(md_parser.render(raw_md))
+    # 读文件是 I/O，线程即可重叠；缺失页面返回空串，随后跳过
+    names = [name for name, _ in chapters]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        raw_mds = list(executor.map(read_wiki_page, names))
+    pages = [(slugs[name], raw_md) for name, raw_md in zip(names, raw_mds) if raw_md]
 
+    # 逐章串行渲染：全部 markdown 只需几十毫秒，进程池（spawn 下每个
+    # worker 重新导入 weasyprint/markdown_it）反而更慢
+    for slug, raw_md in pages:
+        body_html = render_chapter(raw_md, valid_slugs)
         # Wrap in a chapter div with anchor
         html_parts.append(f'<div class="chapter" id="{slug}">\n{body_html}\n</div>')
 
@@ -680,21 +706,18 @@ def build_pdf(chapters: list[tuple[str, str]], css: str, out_path: Path, is_zh:
 """
     full_html = force_text_presentation(full_html)
 
-    # Write intermediate HTML for debugging (optional)
-    html_path = out_path.with_suffix(".html")
-    html_path.write_text(full_html, encoding="utf-8")
+    # Keep the intermediate HTML for debugging; WeasyPrint reads the string
+    if DEBUG:
+        out_path.with_suffix(".html").write_text(full_html, encoding="utf-8")
 
     # Generate PDF
     print(f"  Generating {out_path.name} ...")
     HTML(string=full_html, base_url=str(WIKI_DIR),
-         url_fetcher=image_fetcher).write_pdf(str(out_path))
+         url_fetcher=image_fetcher).write_pdf(str(out_path), font_config=font_config)
     palettize_pdf_images(out_path)
     size_kb = out_path.stat().st_size / 1024
     print(f"  -> {out_path.name} ({size_kb:.0f} KB)")
 
-    # Clean up intermediate HTML
-    html_path.unlink(missing_ok=True)
-
 
 # ---------------------------------------------------------------------------
 # Main
@@ -708,12 +731,16 @@ def main():
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     font_css = build_font_css(ensure_emoji_font())
+    # 中英文两份 PDF 共用字体配置，字体解析结果只算一次
+    font_config = FontConfiguration()
 
     print("Building Chinese PDF ...")
-    build_pdf(ZH_CHAPTERS, font_css + CSS_ZH, OUT_DIR / "luatex-cn-wiki-zh.pdf", is_zh=True)
+    build_pdf(ZH_CHAPTERS, font_css + CSS_ZH, OUT_DIR / "luatex-cn-wiki-zh.pdf", is_zh=True,
+              font_config=font_config)
 
     print("Building English PDF ...")
-    build_pdf(EN_CHAPTERS, font_css + CSS_EN, OUT_DIR / "luatex-cn-wiki-en.pdf", is_zh=False)
+    build_pdf(EN_CHAPTERS, font_css + CSS_EN, OUT_DIR / "luatex-cn-wiki-en.pdf", is_zh=False,
+              font_config=font_config)
 
     # 生成 stamp：记录本次构建对应的 wiki/repo commit，
     # CI workflow 据此判断 wiki 是否有更新、需不需要重建